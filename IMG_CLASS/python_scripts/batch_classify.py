@@ -0,0 +1,133 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image
+from model_runner import ModelRunner
+from model_registry import model_entry
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Per-process state, set up once by init_worker()
+runner = None
+decoder = None
+
+
+def load_label_list(spec):
+    # A labels .txt file (one per line) or a comma separated list
+    if os.path.isfile(spec):
+        with open(spec, 'r') as f:
+            return [line.strip() for line in f.readlines()]
+    return spec.split(',')
+
+
+def find_images(root):
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def init_worker(model_path, batch_size, num_threads):
+    global runner, decoder
+    runner = ModelRunner(model_path, num_threads=num_threads)
+    if batch_size > 1 and not runner.set_batch_size(batch_size):
+        print(f"[{os.getpid()}] {os.path.basename(model_path)} has a fixed batch size, using 1")
+    decoder = ThreadPoolExecutor(max_workers=2)
+
+
+def load_image(path):
+    # Decode and resize off the inference thread; draft() lets JPEGs decode at reduced scale
+    img = Image.open(path)
+    img.draft('RGB', runner.input_size)
+    return runner.prepare(img)
+
+
+def score_chunk(paths):
+    # Decoding runs ahead of inference: map() submits every image of the chunk at once
+    results = []
+    batch = []
+    for path, pixels in zip(paths, decoder.map(load_image, paths)):
+        batch.append((path, pixels))
+        if len(batch) == runner.batch_size:
+            results.extend(score_batch(batch))
+            batch = []
+    if batch:
+        results.extend(score_batch(batch))
+    return results
+
+
+def score_batch(batch):
+    if runner.batch_size == 1:
+        scores = [runner.classify(pixels) for _, pixels in batch]
+    else:
+        scores = runner.classify_batch([pixels for _, pixels in batch])
+    return [(path, [float(p) for p in row]) for (path, _), row in zip(batch, scores)]
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory tree of images with a TFLite classifier")
+    parser.add_argument('image_dir', help='e.g. ./dataset or ./images')
+    parser.add_argument('--model', default='./models/ei-raspi-img-class-int8-quantized-model.tflite')
+    parser.add_argument('--labels', help='labels .txt file or comma separated list (default: the labels '
+                                          'file next to the model, as the live apps find it)')
+    parser.add_argument('--output', default='predictions.csv', help='.csv or .jsonl')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='interpreter processes')
+    parser.add_argument('--threads', type=int, default=1, help='threads per interpreter')
+    parser.add_argument('--batch', type=int, default=8, help='images per invoke(), if the model allows it')
+    parser.add_argument('--chunk', type=int, default=64, help='images handed to a worker at a time')
+    args = parser.parse_args()
+
+    entry = model_entry(args.model)
+    labels = load_label_list(args.labels) if args.labels else entry.labels
+    info = entry.info()
+    if info['kind'] != 'classifier':
+        sys.exit(f"{entry.name} is not a classifier ({info['kind']} outputs)")
+    classes = info['classes']
+    if not labels:
+        sys.exit(f"No labels file found for {entry.name}; pass --labels")
+    if len(labels) != classes:
+        sys.exit(f"{len(labels)} labels for {classes} model outputs ({entry.name}); check --labels")
+    paths = find_images(args.image_dir)
+    if not paths:
+        sys.exit(f"No images found in {args.image_dir}")
+
+    start_time = time.perf_counter()
+    jsonl = args.output.endswith('.jsonl')
+    with open(args.output, 'w', newline='') as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                initargs=(args.model, args.batch, args.threads)) as executor:
+        writer = None
+        if not jsonl:
+            writer = csv.writer(out)
+            writer.writerow(['path', 'folder', 'prediction', 'score'] + labels)
+        for results in executor.map(score_chunk, chunks(paths, args.chunk)):
+            for path, scores in results:
+                best = max(range(len(scores)), key=scores.__getitem__)
+                prediction = labels[best] if best < len(labels) else str(best)
+                folder = os.path.basename(os.path.dirname(path))
+                if jsonl:
+                    out.write(json.dumps({'path': path, 'folder': folder, 'prediction': prediction,
+                                          'score': scores[best],
+                                          'scores': dict(zip(labels, scores))}) + '\n')
+                else:
+                    writer.writerow([path, folder, prediction, f"{scores[best]:.4f}"]
+                                    + [f"{s:.4f}" for s in scores])
+
+    elapsed_time = time.perf_counter() - start_time
+    print(f"Scored {len(paths)} images in {elapsed_time:.1f}s "
+          f"({len(paths) / elapsed_time:.1f} images/s) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
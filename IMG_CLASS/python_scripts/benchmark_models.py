@@ -0,0 +1,195 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from model_runner import ModelRunner
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+CLASS_IMAGES = os.path.join(REPO_DIR, 'IMG_CLASS', 'images')
+DETEC_IMAGES = os.path.join(REPO_DIR, 'OBJ_DETEC', 'images')
+
+# name: (model file relative to the repo, folder with test images)
+MODELS = {
+    'mobilenet_v2_224_quant': ('IMG_CLASS/models/mobilenet_v2_1.0_224_quant.tflite', CLASS_IMAGES),
+    'cifar10': ('IMG_CLASS/models/cifar10.tflite', CLASS_IMAGES),
+    'ei_img_class_int8': ('IMG_CLASS/models/ei-raspi-img-class-int8-quantized-model.tflite', CLASS_IMAGES),
+    'ei_periquito_vs_robot_int8': ('IMG_CLASS/models/ei-periquito-vs-robot-img-class-int8-quantized-model.lite',
+                                   CLASS_IMAGES),
+    'ssd_mobilenet_v1': ('OBJ_DETEC/models/ssd-mobilenet-v1-tflite-default-v1.tflite', DETEC_IMAGES),
+    'ei_ssd_mobilenet_v2_320_int8': ('OBJ_DETEC/models/ei-raspi-object-detection-SSD-MobileNetv2-320x0320-int8.lite',
+                                     DETEC_IMAGES),
+    'ei_fomo_160_int8': ('OBJ_DETEC/models/ei-raspi-object-detection-FOMO-160x160-int8.lite', DETEC_IMAGES),
+}
+
+STAGES = ['decode', 'resize', 'quantize', 'invoke', 'postprocess']
+
+
+def list_images(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+
+
+def postprocess(runner, threshold=0.5):
+    if runner.kind == 'classifier':
+        scores = runner.dequantized(0)
+        return int(np.argmax(scores))
+    if runner.kind == 'ssd':
+        _, _, scores_index, _ = runner.ssd_indices
+        return int(np.count_nonzero(runner.output(scores_index) >= threshold))
+    if runner.kind == 'ssd_raw':
+        scores = max((runner.dequantized(i) for i in range(2)), key=lambda out: out.shape[-1])
+        return int(np.count_nonzero(scores[:, 1:].max(axis=1) >= threshold))
+    heatmap = runner.dequantized(0)
+    return int(np.count_nonzero(heatmap[:, :, 1:].max(axis=2) >= threshold))
+
+
+def timed_pipeline(runner, path):
+    # One image through every stage, returning seconds per stage
+    times = {}
+    t0 = time.perf_counter()
+    img = Image.open(path)
+    img = img.convert('RGB')
+    t1 = time.perf_counter()
+    pixels = runner.prepare(img)
+    t2 = time.perf_counter()
+    runner.set_input(pixels)
+    t3 = time.perf_counter()
+    runner.invoke()
+    t4 = time.perf_counter()
+    postprocess(runner)
+    t5 = time.perf_counter()
+    times['decode'], times['resize'], times['quantize'] = t1 - t0, t2 - t1, t3 - t2
+    times['invoke'], times['postprocess'] = t4 - t3, t5 - t4
+    return times
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000.0
+    return {'p50': round(float(np.percentile(ms, 50)), 3),
+            'p95': round(float(np.percentile(ms, 95)), 3),
+            'p99': round(float(np.percentile(ms, 99)), 3)}
+
+
+def summarize(runs):
+    summary = {stage: percentiles([r[stage] for r in runs]) for stage in STAGES}
+    summary['total'] = percentiles([sum(r.values()) for r in runs])
+    return summary
+
+
+def benchmark_model(name, model_file, image_dir, warm_runs, cold_runs, throughput_seconds):
+    # Runs in its own process so peak RSS and cold starts are per model
+    model_path = os.path.join(REPO_DIR, model_file)
+    images = list_images(image_dir)
+
+    cold, load_times = [], []
+    for i in range(cold_runs):
+        t0 = time.perf_counter()
+        runner = ModelRunner(model_path)
+        load_times.append(time.perf_counter() - t0)
+        cold.append(timed_pipeline(runner, images[i % len(images)]))
+
+    for path in images[:2]:
+        timed_pipeline(runner, path)  # warm-up
+    warm = [timed_pipeline(runner, images[i % len(images)]) for i in range(warm_runs)]
+
+    throughput = {}
+    for threads in range(1, 5):
+        runner = ModelRunner(model_path, num_threads=threads)
+        runner.set_input(Image.open(images[0]))
+        runner.invoke()
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < throughput_seconds:
+            runner.invoke()
+            count += 1
+        throughput[str(threads)] = round(count / (time.perf_counter() - start), 2)
+
+    return name, {
+        'model': model_file,
+        'kind': runner.kind,
+        'input': [runner.height, runner.width, str(np.dtype(runner.input_dtype))],
+        'load_ms': percentiles(load_times),
+        'cold': summarize(cold),
+        'warm': summarize(warm),
+        'invoke_fps_by_threads': throughput,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    }
+
+
+def positive_int(value):
+    # Every phase needs at least one run: the warm phase reuses the last cold
+    # runner, and percentiles of no samples are undefined
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def find_regressions(results, baseline, tolerance):
+    # Compare warm p50 latency per stage against an earlier results file
+    regressions = []
+    for name, result in results['models'].items():
+        previous = baseline.get('models', {}).get(name)
+        if previous is None:
+            continue
+        for stage in STAGES + ['total']:
+            old = previous['warm'][stage]['p50']
+            new = result['warm'][stage]['p50']
+            if old > 0 and new > old * (1 + tolerance) and new - old > 0.05:
+                regressions.append(f"{name} {stage}: {old:.3f} -> {new:.3f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark of the bundled TFLite models")
+    parser.add_argument('--models', nargs='*', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--warm-runs', type=positive_int, default=50)
+    parser.add_argument('--cold-runs', type=positive_int, default=5)
+    parser.add_argument('--throughput-seconds', type=float, default=2.0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed slowdown, 0.15 = 15%%')
+    args = parser.parse_args()
+
+    results = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'models': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for name in args.models:
+        model_file, image_dir = MODELS[name]
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            _, result = executor.submit(benchmark_model, name, model_file, image_dir, args.warm_runs,
+                                        args.cold_runs, args.throughput_seconds).result()
+        results['models'][name] = result
+        warm, cold = result['warm'], result['cold']
+        print(f"{name:30s} warm p50 {warm['total']['p50']:8.2f} ms (invoke {warm['invoke']['p50']:.2f})"
+              f"  cold p50 {cold['total']['p50']:8.2f} ms  fps@1-4 threads "
+              f"{list(result['invoke_fps_by_threads'].values())}  rss {result['peak_rss_mb']} MB")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,139 @@
 from picamera2 import Picamera2
-from flask import Flask, send_from_directory, render_template_string
+from flask import Flask, Response, render_template_string, request
+from collections import deque
+from datetime import datetime, timezone
+from PIL import Image
+import argparse
+import hashlib
+import io
 import time
 import os
 import threading
+from startup import wait_for_first_frame
 
 app = Flask(__name__)
 
-# Global variable to store the latest image filename
-latest_image = None
 
-def capture_dataset(num_images, interval, output_dir="dataset"):
-    global latest_image
+class LatestImage:
+    """The most recent capture, kept in memory for /latest_image.
+
+    Each capture gets an ETag from its content, so browsers revalidate with
+    If-None-Match and get a 304 until a new image arrives. Reduced previews
+    are encoded once per capture and size, on first request; only the
+    ``max_previews`` most recently used sizes are kept, and a width at or
+    above the capture's own is served the original.
+    """
+
+    def __init__(self, max_previews=4):
+        self.lock = threading.Lock()
+        self.jpeg = None
+        self.width = None
+        self.etag = None
+        self.modified = None
+        self.previews = {}
+        self.max_previews = max_previews
+
+    def update(self, jpeg):
+        width = Image.open(io.BytesIO(jpeg)).width  # header only, no decode
+        with self.lock:
+            self.jpeg = jpeg
+            self.width = width
+            self.etag = hashlib.sha1(jpeg).hexdigest()[:16]
+            self.modified = datetime.now(timezone.utc).replace(microsecond=0)
+            self.previews = {}
+
+    def get(self, width=None):
+        # (jpeg, etag, modified) at full size or scaled down to width
+        with self.lock:
+            jpeg, etag, modified = self.jpeg, self.etag, self.modified
+            if jpeg is None or not width or width >= self.width:
+                return jpeg, etag, modified
+            preview = self.previews.pop(width, None)
+            if preview is not None:
+                self.previews[width] = preview  # most recently used goes last
+        if preview is None:
+            img = Image.open(io.BytesIO(jpeg))
+            height = max(1, round(img.height * width / img.width))
+            img.draft('RGB', (width, height))  # decode at reduced scale when possible
+            img = img.resize((width, height))
+            stream = io.BytesIO()
+            img.save(stream, format='JPEG', quality=80)
+            preview = stream.getvalue()
+            with self.lock:
+                if self.etag == etag:
+                    self.previews[width] = preview
+                    while len(self.previews) > self.max_previews:
+                        del self.previews[next(iter(self.previews))]
+        return preview, f"{etag}-{width}", modified
+
+
+class Rotation:
+    """Deletes the oldest captures once a count or disk budget is exceeded."""
+
+    def __init__(self, output_dir, max_images=None, max_bytes=None):
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        # Files from earlier runs count towards the budget too
+        existing = sorted((os.path.join(output_dir, f) for f in os.listdir(output_dir)
+                           if f.startswith('image_') and f.endswith('.jpg')), key=os.path.getmtime)
+        self.files = deque((path, os.path.getsize(path)) for path in existing)
+        self.total_bytes = sum(size for _, size in self.files)
+
+    def add(self, path, size):
+        self.files.append((path, size))
+        self.total_bytes += size
+        while len(self.files) > 1 and ((self.max_images and len(self.files) > self.max_images)
+                                       or (self.max_bytes and self.total_bytes > self.max_bytes)):
+            old_path, old_size = self.files.popleft()
+            self.total_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+
+latest = LatestImage()
+
+def capture_dataset(num_images, interval, output_dir="dataset", size=(640, 480), rotation=None):
+    # num_images=0 captures until stopped (time-lapse)
     os.makedirs(output_dir, exist_ok=True)
     picam2 = Picamera2()
-    config = picam2.create_still_configuration(main={"size": (640, 480)})
+    config = picam2.create_still_configuration(main={"size": size})
     picam2.configure(config)
 
     try:
         picam2.start()
-        time.sleep(2)  # Wait for camera to warm up
+        wait_for_first_frame(picam2)
 
-        for i in range(num_images):
+        # Shots are scheduled on a fixed monotonic grid, so capture time does
+        # not add up; slots that are already over are skipped, not bunched up
+        next_shot = time.monotonic()
+        i = 0
+        while num_images == 0 or i < num_images:
             timestamp = time.strftime("%Y%m%d-%H%M%S")
             filename = f"image_{timestamp}_{i+1:04d}.jpg"
             full_path = os.path.join(output_dir, filename)
 
-            picam2.capture_file(full_path)
-            print(f"Captured image {i+1}/{num_images}: {filename}")
-
-            latest_image = filename  # Update the latest image filename
+            stream = io.BytesIO()
+            picam2.capture_file(stream, format='jpeg')
+            jpeg = stream.getvalue()
+            with open(full_path, 'wb') as f:
+                f.write(jpeg)
+            latest.update(jpeg)
+            if rotation:
+                rotation.add(full_path, len(jpeg))
+            total = num_images or '-'
+            print(f"Captured image {i+1}/{total}: {filename}")
+            i += 1
 
-            if i < num_images - 1:
-                time.sleep(interval)
+            if num_images == 0 or i < num_images:
+                next_shot += interval
+                now = time.monotonic()
+                if now > next_shot:
+                    missed = int((now - next_shot) // interval) + 1
+                    print(f"Capture is {now - next_shot:.2f}s late, skipping {missed} slot(s)")
+                    next_shot += missed * interval
+                time.sleep(max(0, next_shot - time.monotonic()))
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
@@ -47,30 +149,91 @@ def index():
         <head>
             <title>Bee Dataset Viewer</title>
             <script>
+                var lastEtag = null;
                 function refreshImage() {
-                    var img = document.getElementById("latest-image");
-                    img.src = "/latest_image?" + new Date().getTime();
+                    // Revalidates with If-None-Match; unchanged images come back as 304
+                    fetch("/latest_image?width={{ preview_width }}", {cache: "no-cache"})
+                        .then(response => {
+                            const etag = response.headers.get("ETag");
+                            if (!response.ok || etag === lastEtag) return;
+                            lastEtag = etag;
+                            return response.blob().then(blob => {
+                                var img = document.getElementById("latest-image");
+                                var old = img.src;
+                                img.src = URL.createObjectURL(blob);
+                                if (old.startsWith("blob:")) URL.revokeObjectURL(old);
+                            });
+                        });
                 }
-                setInterval(refreshImage, 5000);  // Refresh every 5 seconds
+                refreshImage();
+                setInterval(refreshImage, 5000);  // Check every 5 seconds
             </script>
         </head>
         <body>
             <h1>Latest Captured Image</h1>
-            <img id="latest-image" src="/latest_image" alt="Latest captured image" style="max-width: 100%;">
+            <img id="latest-image" alt="Latest captured image" style="max-width: 100%;">
+            <p><a href="/latest_image">Full size</a></p>
         </body>
         </html>
-    ''')
+    ''', preview_width=preview_width or 0)
 
 @app.route('/latest_image')
 def latest_image():
-    if latest_image:
-        return send_from_directory('dataset', latest_image)
-    else:
+    # ?width=N serves a reduced preview
+    width = request.args.get('width', '')
+    try:
+        width = int(width) if width else None
+    except ValueError:
+        width = -1
+    if width is not None and width < 0:
+        return "width must be a non-negative integer", 400
+    jpeg, etag, modified = latest.get(width)
+    if jpeg is None:
         return "No image captured yet", 404
+    response = Response(jpeg, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+preview_width = 320
+
+def positive_float(value):
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capture a dataset and serve the latest image")
+    parser.add_argument('--num-images', type=int, default=100, help='0 = capture until stopped (time-lapse)')
+    parser.add_argument('--interval', type=positive_float, default=5, help='seconds between captures')
+    parser.add_argument('--output-dir', default='dataset')
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--preview-width', type=non_negative_int, default=preview_width,
+                        help='width of the image shown on the page, 0 = full size')
+    parser.add_argument('--max-images', type=int, help='delete the oldest captures beyond this count')
+    parser.add_argument('--max-disk-mb', type=float, help='delete the oldest captures beyond this size')
+    args = parser.parse_args()
+    preview_width = args.preview_width
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    rotation = None
+    if args.max_images or args.max_disk_mb:
+        max_bytes = int(args.max_disk_mb * 1024 * 1024) if args.max_disk_mb else None
+        rotation = Rotation(args.output_dir, args.max_images, max_bytes)
+
     # Start the image capture in a separate thread
-    capture_thread = threading.Thread(target=capture_dataset, args=(100, 5, "dataset"))
+    capture_thread = threading.Thread(target=capture_dataset,
+                                      args=(args.num_images, args.interval, args.output_dir,
+                                            tuple(args.size), rotation),
+                                      daemon=True)
     capture_thread.start()
 
     # Run the Flask app
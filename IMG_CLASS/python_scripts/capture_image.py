@@ -1,5 +1,5 @@
 from picamera2 import Picamera2
-import time
+from startup import wait_for_first_frame
 
 # Initialize the camera
 picam2 = Picamera2()
@@ -11,8 +11,8 @@ picam2.configure(config)
 # Start the camera
 picam2.start()
 
-# Wait for the camera to warm up
-time.sleep(2)
+# Wait for the camera's first usable frame
+wait_for_first_frame(picam2)
 
 # Capture an image
 picam2.capture_file("usb_camera_image.jpg")
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from queue import Queue
+
+
+def save_unique(image, folder, stamp, prefix='image', quality=90):
+    # Millisecond timestamp names; a suffix is added if the name is taken,
+    # and the exclusive open makes sure nothing is ever overwritten
+    base = time.strftime("%Y%m%d-%H%M%S", time.localtime(stamp)) + f"-{int(stamp * 1000) % 1000:03d}"
+    suffix = 0
+    while True:
+        name = f"{prefix}_{base}.jpg" if suffix == 0 else f"{prefix}_{base}_{suffix}.jpg"
+        path = os.path.join(folder, name)
+        try:
+            f = open(path, 'xb')
+        except FileExistsError:
+            suffix += 1
+            continue
+        with f:
+            image.save(f, format='JPEG', quality=quality)
+        return path
+
+
+class CaptureWriter:
+    """Write-behind saving of captured frames.
+
+    Request handlers only hand over the image; JPEG encoding and disk writes
+    happen on one background thread, in capture order. The queue is bounded
+    so a burst slows down instead of filling memory if the disk falls behind.
+    """
+
+    def __init__(self, quality=90, max_pending=64, on_saved=None, accept=None):
+        self.quality = quality
+        self.on_saved = on_saved  # on_saved(image, folder, path, stamp), called on the writer thread
+        self.accept = accept      # accept(image, folder) -> False drops the frame before it is saved
+        self.queue = Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_path = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image, folder):
+        with self.lock:
+            self.queued += 1
+        self.queue.put((image, folder, time.time()))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            image, folder, stamp = item
+            try:
+                if self.accept and not self.accept(image, folder):
+                    with self.lock:
+                        self.rejected += 1
+                    continue
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                path = save_unique(image, folder, stamp, quality=self.quality)
+                if self.on_saved:
+                    self.on_saved(image, folder, path, stamp)
+                with self.lock:
+                    self.written += 1
+                    self.last_path = path
+            except Exception as e:
+                # Disk errors, but also the accept and on_saved hooks: one bad
+                # frame must not end the thread and leave submit() blocking
+                print(f"Error saving capture: {e.__class__.__name__}: {e}")
+                with self.lock:
+                    self.failed += 1
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        # Writes everything still queued, then stops the thread
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        with self.lock:
+            return {'queued': self.queued, 'written': self.written, 'failed': self.failed,
+                    'rejected': self.rejected,
+                    'pending': self.queued - self.written - self.failed - self.rejected,
+                    'last_file': os.path.basename(self.last_path) if self.last_path else None}
+
+
+class Burst:
+    """Grabs ``count`` frames at ``fps`` from a running stream into a CaptureWriter.
+
+    The schedule is kept against absolute deadlines, so a slow grab shortens
+    the next wait instead of stretching the whole burst.
+    """
+
+    def __init__(self, grab, writer, folder, count, fps, stop_event):
+        self.grab = grab
+        self.writer = writer
+        self.folder = folder
+        self.count = count
+        self.fps = fps
+        self.stop_event = stop_event
+        self.captured = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def run(self):
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        deadline = time.monotonic()
+        try:
+            for _ in range(self.count):
+                if self.stop_event.is_set():
+                    break
+                self.writer.submit(self.grab(), self.folder)
+                self.captured += 1
+                deadline += interval
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self.stop_event.wait(remaining)
+        finally:
+            self.finished = time.monotonic()
+
+    def progress(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {'requested': self.count, 'captured': self.captured, 'fps_target': self.fps,
+                'fps_achieved': round(self.captured / elapsed, 1) if elapsed > 0 else 0.0,
+                'running': self.running()}
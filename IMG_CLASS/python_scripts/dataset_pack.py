@@ -0,0 +1,262 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# One fixed-size record per image in index.bin, appended as images arrive
+INDEX_DTYPE = np.dtype([('shard', '<u4'), ('offset', '<u8'), ('length', '<u4'),
+                        ('label', '<u2'), ('timestamp', '<f8')])
+
+# Layout of a pack directory:
+#   pack.json       format ("array" or "jpeg"), image shape, shard size, labels
+#   index.bin       INDEX_DTYPE records, np.memmap-able
+#   names.txt       source file name of every record, one per line
+#   shard-00000.bin images: N x H x W x 3 uint8 arrays, or JPEG blobs back to back
+
+
+class PackWriter:
+    """Creates a pack or appends to an existing one.
+
+    Image data is written before its index record, so a pack cut short by a
+    crash or power loss still reads back as every image that was indexed.
+    Only one writer should have a pack open at a time.
+    """
+
+    def __init__(self, path, fmt='array', size=(96, 96), shard_size=1024, quality=90):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'pack.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'format': fmt, 'shape': [size[1], size[0], 3], 'shard_size': shard_size,
+                         'quality': quality, 'labels': []}
+            self.save_meta()
+        height, width, channels = self.meta['shape']
+        self.size = (width, height)
+
+        index_path = os.path.join(path, 'index.bin')
+        records = None
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                raw = f.read()
+            records = np.frombuffer(raw[:len(raw) - len(raw) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        if records is not None and len(records):
+            self.shard = int(records['shard'][-1])
+            self.shard_count = int(np.count_nonzero(records['shard'] == self.shard))
+            self.shard_bytes = int(records['offset'][-1] + records['length'][-1])
+            self.count = len(records)
+        else:
+            self.shard, self.shard_count, self.shard_bytes, self.count = 0, 0, 0, 0
+        self.index = open(index_path, 'ab')
+        self.index.truncate(self.count * INDEX_DTYPE.itemsize)
+        self.names = self.open_names(os.path.join(path, 'names.txt'))
+        self.data = None
+        self.open_shard()
+
+    def save_meta(self):
+        tmp_path = os.path.join(self.path, 'pack.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, 'pack.json'))
+
+    def open_names(self, names_path):
+        # names.txt is written last, so after a crash it can be a line short
+        # of the index or hold one for a record whose index write was lost;
+        # cut or pad it to match the index before appending again
+        names = []
+        if os.path.exists(names_path):
+            with open(names_path, 'r') as f:
+                names = f.read().split('\n')[:-1]
+        if len(names) != self.count:
+            names = names[:self.count] + [''] * (self.count - len(names))
+            tmp_path = names_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.writelines(name + '\n' for name in names)
+            os.replace(tmp_path, names_path)
+        return open(names_path, 'a')
+
+    def open_shard(self):
+        if self.data:
+            self.data.close()
+        shard_path = os.path.join(self.path, f"shard-{self.shard:05d}.bin")
+        self.data = open(shard_path, 'ab')
+        # Drop a partially written tail left behind by an interrupted append
+        self.data.truncate(self.shard_bytes)
+
+    def label_id(self, label):
+        labels = self.meta['labels']
+        if label not in labels:
+            labels.append(label)
+            self.save_meta()
+        return labels.index(label)
+
+    def encode(self, image=None, jpeg=None):
+        if self.meta['format'] == 'jpeg':
+            if jpeg is not None:
+                return jpeg
+            stream = io.BytesIO()
+            image.convert('RGB').save(stream, format='JPEG', quality=self.meta['quality'])
+            return stream.getvalue()
+        if image is None:
+            image = Image.open(io.BytesIO(jpeg))
+        if isinstance(image, Image.Image):
+            image.draft('RGB', self.size)
+            image = image.convert('RGB')
+            if image.size != self.size:
+                image = image.resize(self.size)
+            image = np.asarray(image)
+        return np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+
+    def append(self, label, image=None, jpeg=None, name='', timestamp=None):
+        # image: PIL image or HxWx3 array already at the pack size; jpeg: encoded bytes
+        self.append_blob(label, self.encode(image, jpeg), name, timestamp)
+
+    def append_blob(self, label, blob, name='', timestamp=None):
+        # blob: output of encode()
+        if self.shard_count >= self.meta['shard_size']:
+            self.shard, self.shard_count, self.shard_bytes = self.shard + 1, 0, 0
+            self.open_shard()
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['shard'], record['offset'], record['length'] = self.shard, self.shard_bytes, len(blob)
+        record['label'] = self.label_id(label)
+        record['timestamp'] = time.time() if timestamp is None else timestamp
+        self.data.write(blob)
+        self.data.flush()
+        self.index.write(record.tobytes())
+        self.index.flush()
+        self.names.write(name + '\n')
+        self.names.flush()
+        self.shard_count += 1
+        self.shard_bytes += len(blob)
+        self.count += 1
+
+    def close(self):
+        for f in (self.data, self.index, self.names):
+            if f:
+                f.close()
+
+
+class PackedDataset:
+    """Read side of a pack: random access without walking directories.
+
+    ``index`` and the shards are memory mapped; in "array" packs ``image(i)``
+    is a view into the shard, so nothing is decoded or copied until used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'pack.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.format = self.meta['format']
+        self.shape = tuple(self.meta['shape'])
+        self.labels = self.meta['labels']
+        index_path = os.path.join(path, 'index.bin')
+        count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+        self.index = (np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+                      if count else np.zeros(0, dtype=INDEX_DTYPE))
+        self.shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def label_ids(self):
+        return np.asarray(self.index['label'])
+
+    def shard(self, number):
+        data = self.shards.get(number)
+        if data is None:
+            shard_path = os.path.join(self.path, f"shard-{number:05d}.bin")
+            data = np.memmap(shard_path, dtype=np.uint8, mode='r')
+            if self.format == 'array':
+                data = data[:len(data) - len(data) % int(np.prod(self.shape))].reshape((-1,) + self.shape)
+            self.shards[number] = data
+        return data
+
+    def blob(self, i):
+        record = self.index[i]
+        return self.shard(int(record['shard'])), int(record['offset']), int(record['length'])
+
+    def image(self, i):
+        # HxWx3 uint8 array (a memmap view for "array" packs)
+        data, offset, length = self.blob(i)
+        if self.format == 'array':
+            return data[offset // length]
+        return np.asarray(Image.open(io.BytesIO(data[offset:offset + length].tobytes())).convert('RGB'))
+
+    def jpeg(self, i):
+        data, offset, length = self.blob(i)
+        if self.format != 'jpeg':
+            raise ValueError("jpeg() needs a pack written with format 'jpeg'")
+        return data[offset:offset + length].tobytes()
+
+    def label(self, i):
+        return self.labels[int(self.index[i]['label'])]
+
+    def __getitem__(self, i):
+        return self.image(i), int(self.index[i]['label'])
+
+    def names(self):
+        with open(os.path.join(self.path, 'names.txt'), 'r') as f:
+            return [line.rstrip('\n') for line in f][:len(self)]
+
+
+def find_labeled_images(root):
+    # dataset/<label>/<image> -> [(label, path)], sorted for a reproducible pack
+    items = []
+    for label in sorted(os.listdir(root)):
+        folder = os.path.join(root, label)
+        if os.path.isdir(folder):
+            items.extend((label, os.path.join(folder, name)) for name in sorted(os.listdir(folder))
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a dataset/<label>/*.jpg tree into memory-mappable shards")
+    parser.add_argument('dataset_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--format', choices=['array', 'jpeg'], default='array',
+                        help='"array": decoded and resized uint8 images, "jpeg": original files')
+    parser.add_argument('--size', type=int, nargs=2, default=[96, 96], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--shard-size', type=int, default=1024, help='images per shard file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='decoder threads')
+    args = parser.parse_args()
+
+    items = find_labeled_images(args.dataset_dir)
+    if not items:
+        sys.exit(f"No labeled images found under {args.dataset_dir}")
+    if os.path.exists(os.path.join(args.output_dir, 'pack.json')):
+        sys.exit(f"{args.output_dir} already holds a pack")
+    writer = PackWriter(args.output_dir, args.format, tuple(args.size), args.shard_size)
+
+    def load(item):
+        # Runs on the decoder threads; only the file write stays serial
+        label, path = item
+        with open(path, 'rb') as f:
+            raw = f.read()
+        return label, path, writer.encode(jpeg=raw), os.path.getmtime(path)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for label, path, blob, mtime in pool.map(load, items):
+            writer.append_blob(label, blob, os.path.relpath(path, args.dataset_dir), mtime)
+    writer.close()
+
+    dataset = PackedDataset(args.output_dir)
+    total = sum(os.path.getsize(os.path.join(args.output_dir, f)) for f in os.listdir(args.output_dir))
+    print(f"Packed {len(dataset)} images ({', '.join(dataset.labels)}) in {time.time() - start:.1f}s "
+          f"-> {args.output_dir} ({total / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import json
+import threading
+from collections import deque
+
+
+class ResultChannel:
+    """Pushes inference results to Server-Sent Events clients.
+
+    Every published result gets an increasing event id and is sent once to
+    each connected client. A few recent events are kept so a client that
+    reconnects with ``Last-Event-ID`` gets what it missed instead of a gap.
+    """
+
+    def __init__(self, history=32):
+        self.cond = threading.Condition()
+        self.events = deque(maxlen=history)
+        self.next_id = 0
+        self.closed = False
+
+    def publish(self, data):
+        with self.cond:
+            self.events.append((self.next_id, data))
+            self.next_id += 1
+            self.cond.notify_all()
+
+    def latest(self):
+        with self.cond:
+            return self.events[-1][1] if self.events else None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stream(self, last_event_id=None, keepalive=15.0):
+        # New clients (or ids from before a restart) start from the most recent result
+        with self.cond:
+            if last_event_id is None or last_event_id >= self.next_id:
+                last_event_id = max(self.next_id - 2, -1)
+        yield 'retry: 1000\n\n'
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.next_id - 1 > last_event_id or self.closed,
+                                   timeout=keepalive)
+                if self.closed:
+                    return
+                pending = [event for event in self.events if event[0] > last_event_id]
+            if not pending:
+                yield ': keepalive\n\n'
+                continue
+            for event_id, data in pending:
+                yield f"id: {event_id}\ndata: {json.dumps(data)}\n\n"
+                last_event_id = event_id
+
+
+def last_event_id(request):
+    # EventSource resends the id it last saw as a header; ?last_event_id= also works
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
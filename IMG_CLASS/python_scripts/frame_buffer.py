@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+import numpy as np
+from PIL import Image
+
+
+class FrameRingBuffer:
+    """Preallocated ring of raw RGB frames shared between capture and inference.
+
+    The capture thread fills ``next_slot()`` in place and calls ``commit()``;
+    readers take ``latest()`` as a view (no copy, no JPEG decode) and can check
+    with ``is_valid(seq)`` that the writer has not wrapped around onto it.
+    """
+
+    def __init__(self, width, height, slots=4):
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.frames = np.zeros((slots, height, width, 3), dtype=np.uint8)
+        self.timestamps = [0.0] * slots
+        self.seq = -1
+        self.cond = threading.Condition()
+
+    def next_slot(self):
+        # Slot the writer fills before the next commit()
+        return self.frames[(self.seq + 1) % self.slots]
+
+    def commit(self):
+        with self.cond:
+            self.seq += 1
+            self.timestamps[self.seq % self.slots] = time.time()
+            self.cond.notify_all()
+        return self.seq
+
+    def latest(self):
+        seq = self.seq
+        if seq < 0:
+            return -1, None
+        return seq, self.frames[seq % self.slots]
+
+    def wait_for(self, after_seq, timeout=None):
+        # Block until a frame newer than after_seq is committed
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq, timeout=timeout)
+        return self.latest()
+
+    def is_valid(self, seq):
+        # The slot of `seq` is rewritten once the writer starts seq + slots
+        return 0 <= seq and self.seq - seq < self.slots - 1
+
+
+class PiCameraSource:
+    """Reads raw frames from an already started Picamera2 ("RGB888" main stream)."""
+
+    def __init__(self, picam2):
+        self.picam2 = picam2
+
+    def read_into(self, out):
+        array = self.picam2.capture_array("main")
+        # libcamera's RGB888 is laid out as BGR in memory
+        np.copyto(out, array[:, :, 2::-1])
+
+
+class SyntheticSource:
+    """Moving gradient pattern, handy to drive the pipeline without a camera."""
+
+    def __init__(self, width, height):
+        self.count = 0
+        self.xs = np.arange(width, dtype=np.uint16)
+        self.ys = np.arange(height, dtype=np.uint16)[:, None]
+
+    def read_into(self, out):
+        self.count += 1
+        out[:, :, 0] = (self.xs + self.count * 4) & 0xFF
+        out[:, :, 1] = (self.ys + self.count * 2) & 0xFF
+        out[:, :, 2] = ((self.xs + self.ys) // 2 + self.count) & 0xFF
+
+
+class FileSource:
+    """Cycles through an image file or a directory of images, resized once."""
+
+    def __init__(self, path, width, height):
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                           if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+        else:
+            files = [path]
+        if not files:
+            raise ValueError(f"No images found in {path}")
+        self.frames = [np.array(Image.open(f).convert('RGB').resize((width, height)))
+                       for f in files]
+        self.count = 0
+
+    def read_into(self, out):
+        np.copyto(out, self.frames[self.count % len(self.frames)])
+        self.count += 1
+
+
+def make_source(spec, width, height, picam2=None):
+    # spec is "camera", "synthetic" or a path to an image file/directory
+    if spec == "camera":
+        return PiCameraSource(picam2)
+    if spec == "synthetic":
+        return SyntheticSource(width, height)
+    return FileSource(spec, width, height)
@@ -1,21 +1,35 @@
-from flask import Flask, Response, render_template_string, request, redirect, url_for
+from flask import Flask, Response, render_template_string, request, redirect, url_for, jsonify
 from picamera2 import Picamera2
 import io
+import argparse
 import threading
 import time
 import os
 import signal
+from mjpeg_broadcast import FrameBroadcaster
+from capture_writer import CaptureWriter, Burst
+from dataset_pack import PackWriter
+from dedup_index import HashIndex, image_hash
+from startup import wait_for_first_frame
 
 app = Flask(__name__)
 
 # Global variables
 base_dir = "dataset"
 picam2 = None
-frame = None
-frame_lock = threading.Lock()
+broadcaster = FrameBroadcaster()
 capture_counts = {}
 current_label = None
 shutdown_event = threading.Event()
+writer = CaptureWriter()
+burst = None
+pack = None  # optional PackWriter fed with every saved image (--pack)
+dedup_mode = "flag"  # near-duplicate captures: "off", "flag" or "reject"
+dedup_threshold = 5  # max differing bits of the 64-bit perceptual hash
+dedup_index = HashIndex()
+dedup_entry = None   # index entry of the frame the writer is saving
+dedup_match = None   # (similar file, distance) of that frame, if any
+flagged = []
 
 def initialize_camera():
     global picam2
@@ -23,27 +37,64 @@ def initialize_camera():
     config = picam2.create_preview_configuration(main={"size": (320, 240)})
     picam2.configure(config)
     picam2.start()
-    time.sleep(2)  # Wait for camera to warm up
+    wait_for_first_frame(picam2)
 
 def get_frame():
-    global frame
     while not shutdown_event.is_set():
-        stream = io.BytesIO()
-        picam2.capture_file(stream, format='jpeg')
-        with frame_lock:
-            frame = stream.getvalue()
+        # Only encode preview frames while someone is watching
+        if broadcaster.has_viewers():
+            stream = io.BytesIO()
+            picam2.capture_file(stream, format='jpeg')
+            broadcaster.publish(stream.getvalue())
         time.sleep(0.1)  # Adjust as needed for smooth preview
 
-def generate_frames():
-    while not shutdown_event.is_set():
-        with frame_lock:
-            if frame is not None:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.1)  # Adjust as needed for smooth streaming
+def grab_frame():
+    # Still from the running preview stream, no mode switch
+    return picam2.capture_image('main')
+
+def screen_capture(image, folder):
+    # Writer thread, before saving: compare with earlier captures of the label
+    global dedup_entry, dedup_match
+    label = os.path.basename(folder)
+    value = image_hash(image)
+    match = dedup_index.nearest(value, label)
+    dedup_match = None
+    if match and match[0] <= dedup_threshold:
+        if dedup_mode == "reject":
+            capture_counts[label] -= 1
+            return False
+        dedup_match = (dedup_index.names[match[1]], match[0])
+    dedup_entry = dedup_index.add(value, label)
+    return True
+
+def on_saved(image, folder, path, stamp):
+    name = os.path.relpath(path, base_dir)
+    if dedup_mode != "off":
+        dedup_index.names[dedup_entry] = name
+        if dedup_match:
+            flagged.append({'file': name, 'similar_to': dedup_match[0], 'distance': dedup_match[1]})
+    if pack:
+        add_to_pack(image, folder, name, stamp)
+
+def add_to_pack(image, folder, name, stamp):
+    # Runs on the writer thread right after the JPEG is on disk
+    path = os.path.join(base_dir, name)
+    if pack.meta['format'] == 'jpeg':
+        with open(path, 'rb') as f:
+            pack.append(os.path.basename(folder), jpeg=f.read(), name=name, timestamp=stamp)
+    else:
+        pack.append(os.path.basename(folder), image=image, name=name, timestamp=stamp)
 
 def shutdown_server():
     shutdown_event.set()
+    broadcaster.close()
+    if burst:
+        burst.thread.join()
+    writer.close()  # flush frames still waiting to be written
+    if dedup_mode != "off":
+        dedup_index.save(os.path.join(base_dir, '.dedup_index.npz'))
+    if pack:
+        pack.close()
     if picam2:
         picam2.stop()
     # Give some time for other threads to finish
@@ -84,6 +135,37 @@ def capture_page():
         <head>
             <title>Dataset Capture</title>
             <script>
+                function capture() {
+                    fetch('/capture_image', {method: 'POST', headers: {'X-Requested-With': 'XMLHttpRequest'}});
+                }
+                function startBurst() {
+                    const body = new URLSearchParams({count: document.getElementById('burst-count').value,
+                                                      fps: document.getElementById('burst-fps').value});
+                    fetch('/burst', {method: 'POST', body: body})
+                        .then(response => response.json())
+                        .then(data => { if (data.error) alert(data.error); });
+                }
+                function showProgress() {
+                    fetch('/capture_progress')
+                        .then(response => response.json())
+                        .then(data => {
+                            document.getElementById('capture-count').textContent = data.count;
+                            let text = `${data.writer.written} saved, ${data.writer.pending} waiting to be written`;
+                            if (data.dedup.mode === 'reject') {
+                                text += `, ${data.writer.rejected} near-duplicates rejected`;
+                            } else if (data.dedup.mode === 'flag') {
+                                text += `, ${data.dedup.flagged} near-duplicates flagged`;
+                            }
+                            if (data.burst) {
+                                const b = data.burst;
+                                text += ` | burst ${b.captured}/${b.requested} at ${b.fps_achieved} fps` +
+                                        (b.running ? '' : ' (done)');
+                            }
+                            document.getElementById('progress').textContent = text;
+                        });
+                }
+                setInterval(showProgress, 500);
+
                 var shutdownInitiated = false;
                 function checkShutdown() {
                     if (!shutdownInitiated) {
@@ -104,14 +186,17 @@ def capture_page():
         <body>
             <h1>Dataset Capture</h1>
             <p>Current Label: {{ label }}</p>
-            <p>Images captured for this label: {{ capture_count }}</p>
+            <p>Images captured for this label: <span id="capture-count">{{ capture_count }}</span></p>
             <img id="video-feed" src="{{ url_for('video_feed') }}" width="640" height="480" />
             <div id="shutdown-message" style="display: none; color: red;">
                 Capture process has been stopped. You can close this window.
             </div>
-            <form action="/capture_image" method="post">
-                <input type="submit" value="Capture Image">
-            </form>
+            <button onclick="capture()">Capture Image</button>
+            <br>
+            <label>Burst: <input type="number" id="burst-count" min="1" max="500" value="20"> frames at</label>
+            <input type="number" id="burst-fps" min="0.5" max="30" step="0.5" value="5"> fps
+            <button onclick="startBurst()">Capture Burst</button>
+            <p id="progress"></p>
             <form action="/stop" method="post">
                 <input type="submit" value="Stop Capture" style="background-color: #ff6666;">
             </form>
@@ -124,7 +209,9 @@ def capture_page():
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    # Optional per-client frame rate cap, e.g. /video_feed?fps=2
+    max_fps = request.args.get('fps', type=float)
+    return Response(broadcaster.stream(max_fps),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/capture_image', methods=['POST'])
@@ -132,14 +219,39 @@ def capture_image():
     global capture_counts
     if current_label and not shutdown_event.is_set():
         capture_counts[current_label] += 1
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        filename = f"image_{timestamp}.jpg"
-        full_path = os.path.join(base_dir, current_label, filename)
-        
-        picam2.capture_file(full_path)
-    
+        # Saved by the writer thread; the request does not wait for the disk
+        writer.submit(grab_frame(), os.path.join(base_dir, current_label))
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return capture_progress()
     return redirect(url_for('capture_page'))
 
+@app.route('/burst', methods=['POST'])
+def start_burst():
+    # N frames at a target fps from the preview stream, in the background
+    global burst
+    if not current_label or shutdown_event.is_set():
+        return jsonify({'error': 'No label selected'}), 400
+    if burst and burst.running():
+        return jsonify({'error': 'A burst is already running'}), 409
+    count = max(1, min(int(request.form.get('count', 20)), 500))
+    fps = max(0.5, min(float(request.form.get('fps', 5)), 30.0))
+    label = current_label
+
+    def grab():
+        capture_counts[label] += 1
+        return grab_frame()
+
+    burst = Burst(grab, writer, os.path.join(base_dir, label), count, fps, shutdown_event).start()
+    return jsonify(burst.progress())
+
+@app.route('/capture_progress')
+def capture_progress():
+    return jsonify({'label': current_label, 'count': capture_counts.get(current_label, 0),
+                    'writer': writer.stats(), 'burst': burst.progress() if burst else None,
+                    'dedup': {'mode': dedup_mode, 'threshold': dedup_threshold,
+                              'flagged': len(flagged), 'recent': flagged[-5:]}})
+
 @app.route('/stop', methods=['POST'])
 def stop():
     summary = render_template_string('''
@@ -171,6 +283,28 @@ def check_shutdown():
     return {'shutdown': shutdown_event.is_set()}
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capture a labeled image dataset")
+    parser.add_argument('--pack', help='also append every capture to this packed dataset (see dataset_pack.py)')
+    parser.add_argument('--pack-format', choices=['array', 'jpeg'], default='array')
+    parser.add_argument('--pack-size', type=int, nargs=2, default=[96, 96], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--dedup', choices=['off', 'flag', 'reject'], default=dedup_mode,
+                        help='what to do with captures that look like an earlier one of the same label')
+    parser.add_argument('--dedup-threshold', type=int, default=dedup_threshold,
+                        help='max differing perceptual hash bits (of 64) for a near-duplicate')
+    args = parser.parse_args()
+    dedup_mode, dedup_threshold = args.dedup, args.dedup_threshold
+    if args.pack:
+        pack = PackWriter(args.pack, args.pack_format, tuple(args.pack_size))
+    if dedup_mode != "off":
+        # Start from the saved index and hash whatever was added to the folder since
+        index_path = os.path.join(base_dir, '.dedup_index.npz')
+        if os.path.exists(index_path):
+            dedup_index = HashIndex.load(index_path)
+        if os.path.isdir(base_dir):
+            dedup_index.update_from_folder(base_dir)
+        writer.accept = screen_capture
+    writer.on_saved = on_saved
+
     initialize_camera()
     threading.Thread(target=get_frame, daemon=True).start()
     app.run(host='0.0.0.0', port=5000, threaded=True)
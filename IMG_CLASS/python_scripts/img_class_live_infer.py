@@ -1,92 +1,196 @@
 from flask import Flask, Response, render_template_string, request, jsonify
-from picamera2 import Picamera2
 import io
+import argparse
 import threading
 import time
 import numpy as np
 from PIL import Image
-import tflite_runtime.interpreter as tflite
-from queue import Queue
+from queue import Queue, Empty, Full
+from collections import deque, namedtuple
+from concurrent.futures import wait
+from frame_buffer import FrameRingBuffer, make_source
+from mjpeg_broadcast import FrameBroadcaster
+from interpreter_pool import build_pool
+from model_registry import ModelRegistry
+from metrics import PipelineMetrics
+from event_stream import ResultChannel, last_event_id
+from motion_gate import MotionGate
+from startup import Startup, wait_for_first_frame
+
+try:
+    from picamera2 import Picamera2
+except ImportError:  # lets --source synthetic / image folders run without a camera
+    Picamera2 = None
 
 app = Flask(__name__)
 
 # Global variables
+startup = Startup()
 picam2 = None
-frame = None
-frame_lock = threading.Lock()
+frame_size = (320, 240)
+frame_buffer = FrameRingBuffer(*frame_size)
+frame_source = None
+metrics = PipelineMetrics()
+broadcaster = FrameBroadcaster(bytes_counter=metrics.mjpeg_bytes)
 is_classifying = False
 confidence_threshold = 0.8
 model_path = "./models/ei-raspi-img-class-int8-quantized-model.tflite"
-labels = ['background', 'periquito', 'robot']
-interpreter = None
+registry = None  # every model in --models-dir, loaded ones kept in an LRU
+# Everything the worker needs from the active model, replaced as a whole on a
+# switch so a frame never meets the new pool with the old labels
+ModelState = namedtuple('ModelState', 'entry pool strategy report labels')
+model_state = None
+model_lock = threading.Lock()
+pool_config = {'strategy': 'auto', 'size': None, 'num_threads': None,
+               'use_xnnpack': True, 'delegate_path': None}
 classification_queue = Queue(maxsize=1)
+results = ResultChannel()
+motion_gate = MotionGate()
+in_flight = deque()
+
+metrics.watch('mjpeg_clients', 'Connected MJPEG viewers', lambda: broadcaster.clients)
+metrics.watch('inference_queue_depth', 'Frames submitted for inference and not yet post-processed',
+              lambda: len(in_flight))
+metrics.watch('motion_gate_skip_ratio', 'Fraction of frames skipped as unchanged',
+              lambda: motion_gate.stats()['skip_ratio'])
+metrics.watch('motion_gate_cpu_seconds_saved', 'Estimated inference time saved by skipping frames',
+              lambda: motion_gate.stats()['cpu_seconds_saved'])
 
 def initialize_camera():
     global picam2
     picam2 = Picamera2()
-    config = picam2.create_preview_configuration(main={"size": (320, 240)})
+    config = picam2.create_preview_configuration(main={"size": frame_size, "format": "RGB888"})
     picam2.configure(config)
     picam2.start()
-    time.sleep(2)  # Wait for camera to warm up
+    return {'first_frame_seconds': round(wait_for_first_frame(picam2), 3)}
 
 def get_frame():
-    global frame
     while True:
-        stream = io.BytesIO()
-        picam2.capture_file(stream, format='jpeg')
-        with frame_lock:
-            frame = stream.getvalue()
+        slot = frame_buffer.next_slot()
+        with metrics.stage['capture'].time():
+            frame_source.read_into(slot)
+        seq = frame_buffer.commit()
+        metrics.frames_captured.inc()
+        metrics.capture_rate.mark()
+        # Only pay for JPEG encoding while someone is watching the stream
+        if broadcaster.has_viewers():
+            with metrics.stage['encode'].time():
+                stream = io.BytesIO()
+                Image.fromarray(slot).save(stream, format='JPEG')
+            broadcaster.publish(stream.getvalue(), seq)
         time.sleep(0.1)  # Capture frames more frequently
 
-def generate_frames():
-    while True:
-        with frame_lock:
-            if frame is not None:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.1)
-
-def load_model():
-    global interpreter
-    if interpreter is None:
-        interpreter = tflite.Interpreter(model_path=model_path)
-        interpreter.allocate_tensors()
-    return interpreter
-
-def classify_image(img, interpreter):
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-
-    img = img.resize((input_details[0]['shape'][1], input_details[0]['shape'][2]))
-    input_data = np.expand_dims(np.array(img), axis=0).astype(input_details[0]['dtype'])
-
-    interpreter.set_tensor(input_details[0]['index'], input_data)
-    interpreter.invoke()
-
-    predictions = interpreter.get_tensor(output_details[0]['index'])[0]
-    # Handle output based on type
-    output_dtype = output_details[0]['dtype']
-    if output_dtype in [np.int8, np.uint8]:
-        # Dequantize the output
-        scale, zero_point = output_details[0]['quantization']
-        predictions = (predictions.astype(np.float32) - zero_point) * scale
-    return predictions
+def build_model(entry):
+    # Registry loader: an interpreter pool for the model, already warmed up
+    built = build_pool(entry.path, **pool_config)
+    built[0].warm_up()
+    return built
+
+def close_model(built):
+    built[0].close()
+
+def load_model(name=None):
+    # The active model's state; with a name, switch to that model first. The
+    # camera keeps running: the worker submits the next frame to the new pool
+    global model_state
+    with model_lock:
+        if model_state is not None and (name is None or registry.entry(name) is model_state.entry):
+            return model_state
+        # Frames may still be in flight on the old pool, so it stays loaded
+        keep = [model_state.entry.name] if model_state else []
+        entry, (pool, strategy, report) = registry.load(name or model_path, keep)
+        model_state = ModelState(entry, pool, strategy, report, entry.labels)
+        motion_gate.background = None  # classify the next frame, whatever the scene
+        print(f"Model: {entry.name}, inference strategy: {strategy} "
+              f"({pool.size} x {pool.num_threads} threads)")
+        for candidate, result in report.items():
+            print(f"  {candidate}: {result['fps']} fps")
+        return model_state
+
+def prepare_model():
+    # Startup phase: load (and pick a strategy) and warm up every interpreter
+    start = time.perf_counter()
+    load_model()
+    return {'model': model_state.entry.name, 'load_seconds': round(time.perf_counter() - start, 3)}
+
+def classify_frame(runner, raw, seq):
+    # Runs on an interpreter pool thread. The frame is copied into the input
+    # tensor first; if capture has reused its slot meanwhile the copy may be
+    # torn, so the frame is dropped before paying for invoke()
+    with metrics.stage['preprocess'].time():
+        runner.set_input(raw)
+    if not frame_buffer.is_valid(seq):
+        return None, 0.0
+    start = time.perf_counter()
+    runner.invoke()
+    predictions = runner.dequantized(0)
+    inference_seconds = time.perf_counter() - start
+    metrics.stage['inference'].observe(inference_seconds)
+    metrics.frames_inferred.inc()
+    metrics.inference_rate.mark()
+    return predictions, inference_seconds
+
+def discard_in_flight():
+    # On /stop: frames still running belong to the old run; let them finish
+    # (or never start) and forget them, so a later /start shows only new results
+    futures = [future for _, future, _ in in_flight]
+    in_flight.clear()
+    for future in futures:
+        future.cancel()
+    wait(futures)
 
 def classification_worker():
-    interpreter = load_model()
+    load_model()
+    last_seq = -1
     while True:
-        if is_classifying:
-            with frame_lock:
-                if frame is not None:
-                    img = Image.open(io.BytesIO(frame))
-            predictions = classify_image(img, interpreter)
+        if not is_classifying:
+            last_seq = -1
+            discard_in_flight()
+            time.sleep(0.1)
+            continue
+        state = model_state  # read once: a switch mid-frame must not mix two models
+        seq, raw = frame_buffer.wait_for(last_seq, timeout=0.01 if in_flight else 0.5)
+        if raw is not None and seq != last_seq:
+            if last_seq >= 0 and seq > last_seq + 1:
+                metrics.frames_dropped.inc(seq - last_seq - 1)
+            last_seq = seq
+            # Unchanged scene: keep showing the last result
+            if motion_gate.should_run(raw):
+                in_flight.append((seq, state.pool.submit(classify_frame, raw, seq), state))
+        # Post-process finished frames in order while later ones are still running
+        while is_classifying and in_flight and (in_flight[0][1].done() or len(in_flight) >= state.pool.size):
+            frame_seq, future, frame_state = in_flight.popleft()
+            predictions, inference_seconds = future.result()
+            if predictions is None:
+                metrics.frames_dropped.inc()
+                continue  # capture thread overwrote the slot before inference
+            motion_gate.record_inference(inference_seconds)
+            if predictions.max() > 1.0 or predictions.min() < 0.0:
+                # Logits (the ImageNet MobileNet), not probabilities
+                predictions = np.exp(predictions - predictions.max())
+                predictions /= predictions.sum()
             max_prob = np.max(predictions)
-            if max_prob >= confidence_threshold:
-                label = labels[np.argmax(predictions)]
-            else:
+            best = int(np.argmax(predictions))
+            if max_prob < confidence_threshold:
                 label = 'Uncertain'
-            classification_queue.put({'label': label, 'probability': float(max_prob)})
-        time.sleep(0.1)  # Adjust based on your needs
+            elif best < len(frame_state.labels):
+                label = frame_state.labels[best]
+            else:
+                label = f"Class {best}"
+            publish_result({'label': label, 'probability': float(max_prob), 'seq': frame_seq,
+                            'model': frame_state.entry.name})
+
+def publish_result(result):
+    results.publish(result)
+    # /get_classification keeps only the newest result; never block the worker on it
+    try:
+        classification_queue.get_nowait()
+    except Empty:
+        pass
+    try:
+        classification_queue.put_nowait(result)
+    except Full:
+        pass
 
 @app.route('/')
 def index():
@@ -111,13 +215,23 @@ def index():
                     var confidence = $('#confidence').val();
                     $.post('/update_confidence', {confidence: confidence});
                 }
-                function updateClassification() {
-                    $.get('/get_classification', function(data) {
-                        $('#classification').text(data.label + ': ' + data.probability.toFixed(2));
-                    });
+                function switchModel() {
+                    $('#model').prop('disabled', true);
+                    $.post('/models/active', {name: $('#model').val()})
+                        .always(function() { $('#model').prop('disabled', false); });
                 }
                 $(document).ready(function() {
-                    setInterval(updateClassification, 100);  // Update every 100ms
+                    $.getJSON('/models', function(data) {
+                        data.models.forEach(m => $('#model').append(new Option(m.name, m.name)));
+                        $('#model').val(data.active);
+                    });
+                    // Results are pushed as they are produced; EventSource reconnects
+                    // by itself and resumes from the last event id it received
+                    const source = new EventSource('/stream_classification');
+                    source.onmessage = function(event) {
+                        const data = JSON.parse(event.data);
+                        $('#classification').text(data.label + ': ' + data.probability.toFixed(2));
+                    };
                 });
             </script>
         </head>
@@ -131,6 +245,9 @@ def index():
             <label for="confidence">Confidence Threshold:</label>
             <input type="number" id="confidence" name="confidence" min="0" max="1" step="0.1" value="0.8" onchange="updateConfidence()">
             <br>
+            <label for="model">Model:</label>
+            <select id="model" onchange="switchModel()"></select>
+            <br>
             <div id="classification">Waiting for classification...</div>
         </body>
         </html>
@@ -138,7 +255,9 @@ def index():
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    # Optional per-client frame rate cap, e.g. /video_feed?fps=2
+    max_fps = request.args.get('fps', type=float)
+    return Response(broadcaster.stream(max_fps),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/start', methods=['POST'])
@@ -151,6 +270,7 @@ def start_classification():
 def stop_classification():
     global is_classifying
     is_classifying = False
+    publish_result({'label': 'Not classifying', 'probability': 0, 'seq': -1})
     return '', 204
 
 @app.route('/update_confidence', methods=['POST'])
@@ -165,12 +285,113 @@ def get_classification():
         return jsonify({'label': 'Not classifying', 'probability': 0})
     try:
         result = classification_queue.get_nowait()
-    except Queue.Empty:
+    except Empty:
         result = {'label': 'Processing', 'probability': 0}
     return jsonify(result)
 
+@app.route('/stream_classification')
+def stream_classification():
+    # Server-Sent Events: one message per new result, tagged with its frame seq
+    return Response(results.stream(last_event_id(request)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/motion_gate', methods=['GET', 'POST'])
+def motion_gate_settings():
+    # POST any of: enabled (0/1), threshold, pixel_delta, refresh_seconds
+    if request.method == 'POST':
+        if 'enabled' in request.form:
+            motion_gate.enabled = request.form['enabled'] in ('1', 'true', 'on')
+        for name in ('threshold', 'pixel_delta', 'refresh_seconds'):
+            if name in request.form:
+                setattr(motion_gate, name, float(request.form[name]))
+    return jsonify(motion_gate.stats())
+
+@app.route('/models')
+def list_models():
+    return jsonify({'active': model_state.entry.name if model_state else None,
+                    'models': registry.describe(), 'cache': registry.stats()})
+
+@app.route('/models/active', methods=['POST'])
+def switch_model():
+    # Form or JSON field "name": a model listed by /models
+    name = request.form.get('name') or (request.get_json(silent=True) or {}).get('name')
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    start = time.perf_counter()
+    try:
+        registry.entry(name)  # listed models only: load() would also take any path
+        load_model(name)
+    except KeyError:
+        return jsonify({'error': f"unknown model: {name}"}), 404
+    except (ValueError, RuntimeError, OSError) as e:
+        # Not a model the interpreter can run; the active one stays
+        return jsonify({'error': f"cannot load {name}: {e}"}), 400
+    state = model_state
+    return jsonify({'active': state.entry.name, 'labels': state.labels[:20],
+                    'switch_seconds': round(time.perf_counter() - start, 3), 'cache': registry.stats()})
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(startup.health()), 503 if startup.error else 200
+
+@app.route('/readyz')
+def readyz():
+    # 503 until the camera delivers frames and the model is loaded and warm
+    return jsonify(startup.readiness()), 200 if startup.ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/pool_stats')
+def pool_stats():
+    state = model_state
+    if state is None:
+        return jsonify({'strategy': None})
+    return jsonify({'strategy': state.strategy, 'pool_size': state.pool.size,
+                    'num_threads': state.pool.num_threads, 'achieved_fps': round(state.pool.fps(), 1),
+                    'candidates': state.report})
+
 if __name__ == '__main__':
-    initialize_camera()
-    threading.Thread(target=get_frame, daemon=True).start()
-    threading.Thread(target=classification_worker, daemon=True).start()
+    parser = argparse.ArgumentParser(description="Live image classification")
+    parser.add_argument('--source', default='camera',
+                        help='"camera", "synthetic" or an image file/directory')
+    parser.add_argument('--model', default=model_path, help='model file name in --models-dir, or a path')
+    parser.add_argument('--models-dir', action='append',
+                        help='folder to offer models from (repeatable, default ./models)')
+    parser.add_argument('--model-cache-mb', type=float, default=256,
+                        help='memory for loaded models kept around for instant switching')
+    parser.add_argument('--strategy', default='auto', choices=['auto', 'intra-op', 'inter-frame', 'hybrid'],
+                        help='how to spread inference over the CPU cores')
+    parser.add_argument('--pool-size', type=int, help='number of interpreters')
+    parser.add_argument('--num-threads', type=int, help='threads per interpreter')
+    parser.add_argument('--no-xnnpack', action='store_true', help='disable the XNNPACK delegate')
+    parser.add_argument('--delegate', help='path to an external delegate library')
+    parser.add_argument('--motion-threshold', type=float, default=motion_gate.threshold,
+                        help='fraction of changed pixels that triggers inference')
+    parser.add_argument('--motion-refresh', type=float, default=motion_gate.refresh_seconds,
+                        help='seconds after which inference runs even on a static scene')
+    parser.add_argument('--no-motion-gate', action='store_true', help='run inference on every frame')
+    args = parser.parse_args()
+    motion_gate.threshold = args.motion_threshold
+    motion_gate.refresh_seconds = args.motion_refresh
+    motion_gate.enabled = not args.no_motion_gate
+    pool_config.update(strategy=args.strategy, size=args.pool_size, num_threads=args.num_threads,
+                       use_xnnpack=not args.no_xnnpack, delegate_path=args.delegate)
+    model_path = args.model
+    registry = ModelRegistry(args.models_dir or ['./models'], build_model, close_model,
+                             int(args.model_cache_mb * 1024 * 1024))
+
+    def start_camera():
+        global frame_source
+        details = initialize_camera() if args.source == 'camera' else {}
+        frame_source = make_source(args.source, *frame_size, picam2=picam2)
+        return details
+
+    def start_workers():
+        threading.Thread(target=get_frame, daemon=True).start()
+        threading.Thread(target=classification_worker, daemon=True).start()
+
+    # Camera and model come up side by side while the server already answers
+    startup.run({'camera': start_camera, 'model': prepare_model}, then=start_workers)
     app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,201 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class PerThreadValues:
+    """Lock-free accumulation: every thread adds into its own list of floats.
+
+    The lock is only taken the first time a thread records something and when
+    the values are collected; lists of finished threads are folded into
+    ``retired`` so short-lived request threads do not pile up.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.retired = [0.0] * size
+
+    def shard(self):
+        values = getattr(self.local, 'values', None)
+        if values is None:
+            values = [0.0] * self.size
+            with self.lock:
+                self.shards.append((threading.current_thread(), values))
+            self.local.values = values
+        return values
+
+    def totals(self):
+        with self.lock:
+            alive = []
+            for thread, values in self.shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    self.retired = [a + b for a, b in zip(self.retired, values)]
+            self.shards = alive
+            totals = list(self.retired)
+            for _, values in alive:
+                totals = [a + b for a, b in zip(totals, values)]
+        return totals
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self):
+        self.values = PerThreadValues(1)
+
+    def inc(self, amount=1):
+        self.values.shard()[0] += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.values.totals()[0])]
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        return [(name, labels, self.fn() if self.fn else self.value)]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket, one for +Inf, then the running sum
+        self.values = PerThreadValues(len(self.buckets) + 2)
+
+    def observe(self, value):
+        shard = self.values.shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        return Timer(self)
+
+    def samples(self, name, labels):
+        totals = self.values.totals()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), totals):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append((name + '_bucket', dict(labels, le=le), cumulative))
+        samples.append((name + '_sum', labels, totals[-1]))
+        samples.append((name + '_count', labels, cumulative))
+        return samples
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class RateMeter:
+    """Events per second over the last ``window`` events (e.g. fps)."""
+
+    def __init__(self, window=30):
+        self.stamps = deque(maxlen=window)
+
+    def mark(self):
+        self.stamps.append(time.monotonic())
+
+    def rate(self):
+        stamps = list(self.stamps)
+        if len(stamps) < 2 or time.monotonic() - stamps[-1] > 5.0:
+            return 0.0
+        return (len(stamps) - 1) / (stamps[-1] - stamps[0])
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text format."""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.metrics = []
+
+    def register(self, name, help_text, metric, labels=None):
+        self.metrics.append((self.prefix + name, help_text, labels or {}, metric))
+        return metric
+
+    def counter(self, name, help_text, labels=None):
+        return self.register(name, help_text, Counter(), labels)
+
+    def gauge(self, name, help_text, fn=None, labels=None):
+        return self.register(name, help_text, Gauge(fn), labels)
+
+    def histogram(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        return self.register(name, help_text, Histogram(buckets), labels)
+
+    def render(self):
+        # Samples of one metric family must be contiguous, so group by name
+        families = {}
+        for name, help_text, labels, metric in self.metrics:
+            families.setdefault(name, []).append((help_text, labels, metric))
+        lines = []
+        for name, members in families.items():
+            lines.append(f"# HELP {name} {members[0][0]}")
+            lines.append(f"# TYPE {name} {members[0][2].kind}")
+            for _, labels, metric in members:
+                for sample_name, sample_labels, value in metric.samples(name, labels):
+                    if sample_labels:
+                        label_text = ','.join(f'{k}="{v}"' for k, v in sample_labels.items())
+                        sample_name = f"{sample_name}{{{label_text}}}"
+                    lines.append(f"{sample_name} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class PipelineMetrics:
+    """Standard metrics of a capture -> inference -> MJPEG app."""
+
+    STAGES = ('capture', 'preprocess', 'inference', 'encode')
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.stage = {stage: self.registry.histogram('frame_stage_seconds',
+                                                     'Seconds spent on one frame per pipeline stage',
+                                                     {'stage': stage})
+                      for stage in self.STAGES}
+        self.frames_captured = self.registry.counter('frames_captured_total', 'Frames captured')
+        self.frames_inferred = self.registry.counter('frames_inferred_total', 'Frames run through the model')
+        self.frames_dropped = self.registry.counter('frames_dropped_total',
+                                                    'Captured frames skipped by the inference worker')
+        self.mjpeg_bytes = self.registry.counter('mjpeg_bytes_sent_total', 'Bytes sent to MJPEG viewers')
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.registry.gauge('capture_fps', 'Recent capture rate', self.capture_rate.rate)
+        self.registry.gauge('inference_fps', 'Recent inference rate', self.inference_rate.rate)
+
+    def watch(self, name, help_text, fn):
+        # Gauge read from fn() at scrape time
+        self.registry.gauge(name, help_text, fn)
+
+    def render(self):
+        return self.registry.render()
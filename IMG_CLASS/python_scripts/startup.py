@@ -0,0 +1,98 @@
+import threading
+import time
+import numpy as np
+
+
+def wait_for_first_frame(picam2, stream="main", timeout=5.0):
+    """Return as soon as the camera delivers a usable frame, instead of sleeping.
+
+    The first buffers after ``picam2.start()`` can come back all black while
+    the sensor and auto exposure start up. ``capture_array`` already blocks
+    until the next frame, so polling it costs nothing extra. Returns the
+    seconds waited; after ``timeout`` the camera is used as it is.
+    """
+    start = time.monotonic()
+    while True:
+        frame = picam2.capture_array(stream)
+        if frame is not None and frame.size and np.any(frame[::8, ::8]):
+            return time.monotonic() - start
+        if time.monotonic() - start > timeout:
+            print(f"Camera still sends blank frames after {timeout:.0f}s; continuing anyway")
+            return time.monotonic() - start
+        time.sleep(0.01)
+
+
+class Startup:
+    """Startup phases run concurrently, with the timings /readyz reports.
+
+    ``run({'camera': fn, 'model': fn}, then=fn)`` starts one thread per phase
+    and returns at once, so the web server can answer health checks while
+    the model loads. A phase may return a dict of details to report; ``then``
+    runs once every phase succeeded, as a last phase called "start", after
+    which the app is ready. Any phase that raises leaves the app not ready,
+    with its error in both /healthz and /readyz.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.ready_after = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self.ready_after is not None
+
+    def _phase(self, name, fn):
+        start = time.monotonic()
+        try:
+            details = fn() or {}
+        except Exception as e:
+            with self.lock:
+                self.phases[name].update(state='failed', error=str(e))
+                self.error = f"{name}: {e}"
+            raise
+        with self.lock:
+            self.phases[name].update(details if isinstance(details, dict) else {}, state='done',
+                                     seconds=round(time.monotonic() - start, 3))
+
+    def _begin(self, name):
+        with self.lock:
+            self.phases[name] = {'state': 'running', 'started_after': round(time.monotonic() - self.started, 3)}
+
+    def run(self, phases, then=None):
+        for name in phases:
+            self._begin(name)
+        threads = [threading.Thread(target=self._phase, args=(name, fn), daemon=True, name=f"startup-{name}")
+                   for name, fn in phases.items()]
+        for thread in threads:
+            thread.start()
+
+        def finish():
+            for thread in threads:
+                thread.join()
+            if not self.error and then:
+                self._begin('start')
+                try:
+                    self._phase('start', then)
+                except Exception:
+                    pass  # recorded by _phase
+            if self.error:
+                print(f"Startup failed: {self.error}")
+                return
+            self.ready_after = round(time.monotonic() - self.started, 3)
+            print(f"Ready after {self.ready_after}s: "
+                  + ', '.join(f"{name} {phase['seconds']}s" for name, phase in self.phases.items()))
+
+        threading.Thread(target=finish, daemon=True, name='startup').start()
+
+    def health(self):
+        # Liveness: the process is up and serving, whatever the phases are doing
+        return {'status': 'failed' if self.error else 'ok',
+                'uptime_seconds': round(time.monotonic() - self.started, 3)}
+
+    def readiness(self):
+        with self.lock:
+            return {'ready': self.ready, 'ready_after_seconds': self.ready_after, 'error': self.error,
+                    'phases': {name: dict(phase) for name, phase in self.phases.items()}}
@@ -0,0 +1,144 @@
+import argparse
+import os
+import shutil
+import sys
+import numpy as np
+from PIL import Image
+from dataset_pack import find_labeled_images
+
+# Set bits per byte value, for numpy versions without np.bitwise_count
+POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    # Set bits of every uint64 in values
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def image_hash(image):
+    # 64-bit difference hash: 9x8 grayscale thumbnail, one bit per
+    # horizontal neighbour pair, robust to small noise, exposure and JPEG loss
+    if image.mode != 'L':
+        image.draft('L', (64, 64))
+        image = image.convert('L')
+    pixels = np.asarray(image.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return np.uint64(bits.view('>u8')[0])
+
+
+def file_hash(path):
+    with Image.open(path) as image:
+        return image_hash(image)
+
+
+class HashIndex:
+    """Perceptual hashes of captured images with Hamming distance lookups.
+
+    Hashes live in one packed uint64 array (grown by doubling), so a lookup
+    is a single XOR plus popcount over the whole array. Entries carry a label
+    so lookups can stay within one class folder.
+    """
+
+    def __init__(self):
+        self.hashes = np.zeros(256, dtype=np.uint64)
+        self.label_ids = np.zeros(256, dtype=np.uint16)
+        self.names = []
+        self.labels = []
+        self.count = 0
+
+    def label_id(self, label):
+        if label not in self.labels:
+            self.labels.append(label)
+        return self.labels.index(label)
+
+    def add(self, value, label, name=None):
+        if self.count == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+            self.label_ids = np.concatenate([self.label_ids, np.zeros_like(self.label_ids)])
+        self.hashes[self.count] = value
+        self.label_ids[self.count] = self.label_id(label)
+        self.names.append(name)
+        self.count += 1
+        return self.count - 1
+
+    def distances(self, value, label=None):
+        distances = popcount(self.hashes[:self.count] ^ np.uint64(value)).astype(np.int16)
+        if label is not None:
+            if label not in self.labels:
+                return np.full(self.count, 65, dtype=np.int16)
+            distances[self.label_ids[:self.count] != self.labels.index(label)] = 65
+        return distances
+
+    def nearest(self, value, label=None):
+        # (distance, entry) of the closest hash, or None if there is nothing to compare
+        if not self.count:
+            return None
+        distances = self.distances(value, label)
+        best = int(np.argmin(distances))
+        return (int(distances[best]), best) if distances[best] <= 64 else None
+
+    def save(self, path):
+        np.savez(path, hashes=self.hashes[:self.count], label_ids=self.label_ids[:self.count],
+                 names=np.array([n or '' for n in self.names]), labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with np.load(path) as data:
+            labels = [str(label) for label in data['labels']]
+            for value, label_id, name in zip(data['hashes'], data['label_ids'], data['names']):
+                index.add(value, labels[label_id], str(name) or None)
+        return index
+
+    def update_from_folder(self, root):
+        # Hashes images under root/<label>/ that are not indexed yet
+        known = set(self.names)
+        added = 0
+        for label, path in find_labeled_images(root):
+            name = os.path.relpath(path, root)
+            if name not in known:
+                self.add(file_hash(path), label, name)
+                added += 1
+        return added
+
+
+def find_duplicates(root, threshold):
+    # Files in capture (name) order; an image within threshold bits of an
+    # earlier kept image of the same label is a duplicate of it
+    index = HashIndex()
+    duplicates = []
+    for label, path in find_labeled_images(root):
+        value = file_hash(path)
+        match = index.nearest(value, label)
+        if match and match[0] <= threshold:
+            duplicates.append((path, index.names[match[1]], match[0]))
+        else:
+            index.add(value, label, path)
+    return index, duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images in a dataset/<label>/ tree")
+    parser.add_argument('dataset_dir')
+    parser.add_argument('--threshold', type=int, default=5, help='max differing hash bits (of 64)')
+    parser.add_argument('--move-to', help='move duplicates into this folder (keeps the label subfolders)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dataset_dir):
+        sys.exit(f"{args.dataset_dir} is not a directory")
+    index, duplicates = find_duplicates(args.dataset_dir, args.threshold)
+    for path, original, distance in duplicates:
+        print(f"{path}  ~  {os.path.basename(original)}  ({distance} bits)")
+        if args.move_to:
+            target = os.path.join(args.move_to, os.path.relpath(path, args.dataset_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+    total = index.count + len(duplicates)
+    action = f", moved to {args.move_to}" if args.move_to else ""
+    print(f"{len(duplicates)} near-duplicates among {total} images{action}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import numpy as np
+from model_runner import tensor_order
+
+# Every decoder returns (boxes, class_ids, scores) sorted by score, with boxes
+# as an (N, 4) float32 array of [left, top, right, bottom] in 0..1 coordinates.
+
+
+def empty_result():
+    return (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.float32))
+
+
+def iou_one_to_many(box, boxes):
+    left = np.maximum(box[0], boxes[:, 0])
+    top = np.maximum(box[1], boxes[:, 1])
+    right = np.minimum(box[2], boxes[:, 2])
+    bottom = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes, scores, class_ids, iou_threshold=0.5, max_detections=10):
+    # Per-class greedy NMS; shifting each class to its own region of the
+    # plane keeps boxes of different classes from suppressing each other
+    shifted = boxes + (class_ids * 2.0)[:, None]
+    order = np.argsort(-scores)
+    keep = []
+    while order.size and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        order = rest[iou_one_to_many(shifted[best], shifted[rest]) <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+
+def ssd_anchors(input_size, num_layers=6, min_scale=0.2, max_scale=0.95,
+                aspect_ratios=(1.0, 2.0, 0.5, 3.0, 1.0 / 3.0), strides=(16, 32, 64, 128, 256, 512)):
+    # Default anchors of the TF Object Detection API SSD MobileNet configs,
+    # as an (N, 4) array of [center_y, center_x, height, width]
+    width, height = input_size
+    scales = [min_scale + (max_scale - min_scale) * i / (num_layers - 1) for i in range(num_layers)] + [1.0]
+    anchors = []
+    for layer in range(num_layers):
+        rows, cols = -(-height // strides[layer]), -(-width // strides[layer])
+        if layer == 0:
+            shapes = [(1.0, 0.1), (2.0, scales[0]), (0.5, scales[0])]
+        else:
+            shapes = [(ratio, scales[layer]) for ratio in aspect_ratios]
+            shapes.append((1.0, np.sqrt(scales[layer] * scales[layer + 1])))
+        ratios = np.array([s[0] for s in shapes])
+        sizes = np.array([s[1] for s in shapes])
+        cy, cx = np.meshgrid((np.arange(rows) + 0.5) / rows, (np.arange(cols) + 0.5) / cols, indexing='ij')
+        layer_anchors = np.empty((rows, cols, len(shapes), 4), dtype=np.float32)
+        layer_anchors[..., 0] = cy[..., None]
+        layer_anchors[..., 1] = cx[..., None]
+        layer_anchors[..., 2] = sizes / np.sqrt(ratios)
+        layer_anchors[..., 3] = sizes * np.sqrt(ratios)
+        anchors.append(layer_anchors.reshape(-1, 4))
+    return np.concatenate(anchors)
+
+
+class PostProcessedSSDDecoder:
+    """SSD with the TFLite_Detection_PostProcess op: boxes, classes, scores, count."""
+
+    def __init__(self, runner):
+        self.indices = runner.ssd_indices
+
+    def __call__(self, runner, threshold):
+        boxes_index, classes_index, scores_index, count_index = self.indices
+        count = int(runner.output(count_index).flat[0])
+        scores = runner.output(scores_index)[:count]
+        keep = np.flatnonzero(scores >= threshold)
+        if not keep.size:
+            return empty_result()
+        # [ymin, xmin, ymax, xmax] -> [left, top, right, bottom]
+        boxes = np.clip(runner.output(boxes_index)[keep][:, [1, 0, 3, 2]], 0.0, 1.0)
+        class_ids = runner.output(classes_index)[keep].astype(np.int32)
+        return boxes.astype(np.float32), class_ids, scores[keep].astype(np.float32)
+
+
+class RawSSDDecoder:
+    """SSD exported without post-processing: box encodings and class scores per anchor.
+
+    Encodings are decoded against the anchors in one vectorized pass, scores
+    below the threshold are dropped before NMS so NMS only sees candidates.
+    """
+
+    def __init__(self, runner, anchors=None, iou_threshold=0.5, max_detections=10,
+                 box_scales=(10.0, 10.0, 5.0, 5.0), background_class=True):
+        details = runner.output_details
+        order = sorted(range(len(details)), key=lambda i: tensor_order(details[i]))
+        self.boxes_index = next(i for i in order if details[i]['shape'][-1] == 4)
+        self.scores_index = next(i for i in order if i != self.boxes_index)
+        num_anchors = int(details[self.boxes_index]['shape'][1])
+        self.anchors = ssd_anchors(runner.input_size) if anchors is None else np.asarray(anchors, np.float32)
+        if len(self.anchors) != num_anchors:
+            raise ValueError(f"Model has {num_anchors} anchors but {len(self.anchors)} were given; "
+                             f"pass the model's anchors file")
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.box_scales = np.array(box_scales, dtype=np.float32)
+        self.first_class = 1 if background_class else 0
+
+    def __call__(self, runner, threshold):
+        scores = runner.dequantized(self.scores_index)[:, self.first_class:]
+        if scores.min() < 0.0 or scores.max() > 1.0:
+            scores = 1.0 / (1.0 + np.exp(-scores))  # logits
+        class_ids = scores.argmax(axis=1)
+        best = scores[np.arange(len(scores)), class_ids]
+        keep = np.flatnonzero(best >= threshold)
+        if not keep.size:
+            return empty_result()
+
+        encoded = runner.dequantized(self.boxes_index)[keep] / self.box_scales
+        anchors = self.anchors[keep]
+        cy = encoded[:, 0] * anchors[:, 2] + anchors[:, 0]
+        cx = encoded[:, 1] * anchors[:, 3] + anchors[:, 1]
+        half_h = np.exp(encoded[:, 2]) * anchors[:, 2] / 2
+        half_w = np.exp(encoded[:, 3]) * anchors[:, 3] / 2
+        boxes = np.clip(np.stack([cx - half_w, cy - half_h, cx + half_w, cy + half_h], axis=1), 0.0, 1.0)
+
+        class_ids = class_ids[keep].astype(np.int32)
+        selected = nms(boxes, best[keep], class_ids, self.iou_threshold, self.max_detections)
+        return boxes[selected].astype(np.float32), class_ids[selected], best[keep][selected].astype(np.float32)
+
+
+def label_regions(mask):
+    # 4-connected components of a small boolean grid by repeated min-label
+    # propagation; background cells get 0
+    size = mask.size
+    labels = np.where(mask, np.arange(1, size + 1).reshape(mask.shape), size + 1)
+    while True:
+        padded = np.pad(labels, 1, constant_values=size + 1)
+        merged = np.minimum.reduce([labels, padded[:-2, 1:-1], padded[2:, 1:-1],
+                                    padded[1:-1, :-2], padded[1:-1, 2:]])
+        merged = np.where(mask, merged, size + 1)
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+    return np.where(mask, labels, 0)
+
+
+class FomoDecoder:
+    """FOMO heatmap: per-cell class probabilities, channel 0 is background.
+
+    Neighbouring cells of the same class above the threshold form one object;
+    its box spans those cells and its score is their highest probability.
+    """
+
+    def __call__(self, runner, threshold):
+        heatmap = runner.dequantized(0)
+        rows, cols, channels = heatmap.shape
+        winners = heatmap.argmax(axis=2)
+        results = []
+        for channel in range(1, channels):
+            mask = (winners == channel) & (heatmap[:, :, channel] >= threshold)
+            if not mask.any():
+                continue
+            _, region = np.unique(label_regions(mask)[mask], return_inverse=True)
+            ys, xs = np.nonzero(mask)
+            count = region.max() + 1
+            top = np.full(count, rows)
+            left = np.full(count, cols)
+            bottom = np.zeros(count, dtype=np.intp)
+            right = np.zeros(count, dtype=np.intp)
+            score = np.zeros(count, dtype=np.float32)
+            np.minimum.at(top, region, ys)
+            np.minimum.at(left, region, xs)
+            np.maximum.at(bottom, region, ys + 1)
+            np.maximum.at(right, region, xs + 1)
+            np.maximum.at(score, region, heatmap[ys, xs, channel])
+            boxes = np.stack([left / cols, top / rows, right / cols, bottom / rows], axis=1)
+            results.append((boxes.astype(np.float32), np.full(count, channel - 1, dtype=np.int32), score))
+        if not results:
+            return empty_result()
+        boxes, class_ids, scores = (np.concatenate(parts) for parts in zip(*results))
+        order = np.argsort(-scores)
+        return boxes[order], class_ids[order], scores[order]
+
+
+def make_decoder(runner, anchors=None):
+    # Picks the decoder matching the model's output signature
+    if runner.kind == 'ssd':
+        return PostProcessedSSDDecoder(runner)
+    if runner.kind == 'ssd_raw':
+        return RawSSDDecoder(runner, anchors)
+    if runner.kind == 'fomo':
+        return FomoDecoder()
+    raise ValueError(f"{runner.model_path} is a {runner.kind} model, not a detector")
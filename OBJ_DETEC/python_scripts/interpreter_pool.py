@@ -0,0 +1,153 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tflite_runtime.interpreter as tflite
+from model_runner import ModelRunner
+
+# Ways to spend the CPU cores: (number of interpreters, threads per interpreter)
+STRATEGIES = {
+    'intra-op': lambda cores: (1, cores),
+    'inter-frame': lambda cores: (cores, 1),
+    'hybrid': lambda cores: (max(cores // 2, 1), 2),
+}
+
+# Benchmark results of choose_strategy(), so a restart does not repeat them
+STRATEGY_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'interpreter_pool_strategy.json')
+
+
+class InterpreterPool:
+    """A fixed set of ModelRunners shared by a thread pool.
+
+    ``submit(fn, *args)`` runs ``fn(runner, *args)`` on whichever interpreter
+    is free, so frame N+1 can be inferred while the caller post-processes
+    frame N. Each task must finish with the runner's output views.
+    """
+
+    def __init__(self, model_path, size=1, num_threads=None, use_xnnpack=True,
+                 delegate_path=None):
+        self.model_path = model_path
+        self.size = size
+        self.num_threads = num_threads
+        self.idle = queue.Queue()
+        for _ in range(size):
+            delegates = [tflite.load_delegate(delegate_path)] if delegate_path else None
+            self.idle.put(ModelRunner(model_path, num_threads, delegates, use_xnnpack))
+        # Metadata (input size, head kind, ...) is the same for every runner
+        self.runner = self.idle.queue[0]
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='inference')
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.started_at = time.monotonic()
+
+    def submit(self, fn, *args):
+        return self.executor.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        runner = self.idle.get()
+        try:
+            return fn(runner, *args)
+        finally:
+            self.idle.put(runner)
+            with self.lock:
+                self.completed += 1
+
+    def warm_up(self, runs=1):
+        # The first invoke() of an interpreter pays for delegate set-up and
+        # weight packing; do it on every runner, in parallel, before real frames
+        frame = np.zeros((self.runner.height, self.runner.width, 3), dtype=np.uint8)
+        runners = list(self.idle.queue)
+        start = time.perf_counter()
+        for _ in range(runs):
+            list(self.executor.map(lambda runner: runner.run(frame), runners))
+        self.started_at = time.monotonic()
+        return time.perf_counter() - start
+
+    def fps(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def measure_fps(pool, frame, duration=1.0):
+    # Keep every interpreter busy on the same frame and count completions
+    in_flight = deque()
+    done = 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        while len(in_flight) < pool.size * 2:
+            in_flight.append(pool.submit(lambda runner, img: runner.run(img), frame))
+        in_flight.popleft().result()
+        done += 1
+    elapsed = time.monotonic() - start
+    for future in in_flight:
+        future.result()
+    return done / elapsed
+
+
+def choose_strategy(model_path, cores=None, duration=1.0, use_xnnpack=True, delegate_path=None):
+    # Benchmark every strategy on this model and return (best, report)
+    cores = cores or os.cpu_count() or 1
+    report = {}
+    tried = set()
+    for name, layout in STRATEGIES.items():
+        size, threads = layout(cores)
+        if (size, threads) in tried:
+            continue
+        tried.add((size, threads))
+        pool = InterpreterPool(model_path, size, threads, use_xnnpack, delegate_path)
+        frame = np.random.randint(0, 256, (pool.runner.height, pool.runner.width, 3), dtype=np.uint8)
+        pool.runner.run(frame)  # warm-up
+        report[name] = {'pool_size': size, 'num_threads': threads,
+                        'fps': round(measure_fps(pool, frame, duration), 1)}
+        pool.close()
+    best = max(report, key=lambda name: report[name]['fps'])
+    return best, report
+
+
+def strategy_cache_key(model_path, cores, use_xnnpack, delegate_path):
+    # A different model file, core count or delegate means a new benchmark
+    stat = os.stat(model_path)
+    return json.dumps([os.path.abspath(model_path), stat.st_size, int(stat.st_mtime), cores,
+                       use_xnnpack, delegate_path])
+
+
+def cached_strategy(model_path, cores, use_xnnpack=True, delegate_path=None, path=STRATEGY_CACHE):
+    # choose_strategy() once per model and machine; the answer is kept on disk
+    key = strategy_cache_key(model_path, cores, use_xnnpack, delegate_path)
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if key in cache:
+        return cache[key]['strategy'], cache[key]['report']
+    strategy, report = choose_strategy(model_path, cores, use_xnnpack=use_xnnpack, delegate_path=delegate_path)
+    cache[key] = {'strategy': strategy, 'report': report}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(cache, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass  # read-only home: benchmark again next time
+    return strategy, report
+
+
+def build_pool(model_path, strategy='auto', size=None, num_threads=None,
+               use_xnnpack=True, delegate_path=None):
+    # Returns (pool, strategy name, per-strategy fps report)
+    cores = os.cpu_count() or 1
+    report = {}
+    if strategy == 'auto':
+        strategy, report = cached_strategy(model_path, cores, use_xnnpack, delegate_path)
+    default_size, default_threads = STRATEGIES[strategy](cores)
+    pool = InterpreterPool(model_path, size or default_size, num_threads or default_threads,
+                           use_xnnpack, delegate_path)
+    return pool, strategy, report
@@ -0,0 +1,64 @@
+import threading
+import time
+
+
+class FrameBroadcaster:
+    """Encode-once MJPEG fan-out for any number of viewers.
+
+    The capture thread publishes each JPEG once together with its frame
+    sequence number. Every client waits on a condition for a newer sequence
+    and always takes the newest frame, so slow clients skip frames instead of
+    queueing them. Nothing is yielded to a socket while the lock is held.
+    """
+
+    def __init__(self, bytes_counter=None):
+        # bytes_counter: optional metrics.Counter fed with every chunk sent
+        self.bytes_counter = bytes_counter
+        self.cond = threading.Condition()
+        self.jpeg = None
+        self.seq = -1
+        self.clients = 0
+        self.closed = False
+
+    def has_viewers(self):
+        return self.clients > 0
+
+    def publish(self, jpeg, seq=None):
+        with self.cond:
+            self.seq = self.seq + 1 if seq is None else seq
+            self.jpeg = jpeg
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stream(self, max_fps=None):
+        # Generator of multipart chunks for one client, optionally capped at max_fps
+        min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+        with self.cond:
+            self.clients += 1
+        try:
+            last_seq = -1
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.seq > last_seq or self.closed, timeout=5.0)
+                    if self.closed:
+                        return
+                    if self.seq <= last_seq:
+                        continue
+                    last_seq, jpeg = self.seq, self.jpeg
+                sent_at = time.monotonic()
+                chunk = (b'--frame\r\n'
+                         b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+                yield chunk
+                if self.bytes_counter is not None:
+                    self.bytes_counter.inc(len(chunk))
+                if min_interval:
+                    remaining = min_interval - (time.monotonic() - sent_at)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        finally:
+            with self.cond:
+                self.clients -= 1
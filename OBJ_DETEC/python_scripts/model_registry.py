@@ -0,0 +1,216 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import tflite_runtime.interpreter as tflite
+from model_runner import model_kind, read_sidecar
+
+MODEL_EXTENSIONS = ('.tflite', '.lite')
+
+
+def read_labels(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def resident_bytes():
+    # Resident set size of this process, or None where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ModelEntry:
+    """A model file the registry knows about, with its labels and metadata.
+
+    Labels come from, in order: a ``<stem>.json`` sidecar (``"labels"``: a
+    list or a file name), ``<stem>-labels.txt``, the ``<prefix>-labels.txt``
+    with the longest prefix of the model's name, and finally a folder-wide
+    labels file with as many lines as the model has classes (or the only one
+    there, for detectors). The sidecar may also carry ``anchors`` (a .npy
+    file for raw SSD models), ``input_range`` (the pixel range a float model
+    was trained on, read by ModelRunner) and a ``description``.
+    """
+
+    def __init__(self, path, label_files=()):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(path)
+        self.folder = os.path.dirname(self.path)
+        self.stem = os.path.splitext(self.name)[0]
+        self.label_files = list(label_files)
+        self.metadata = read_sidecar(self.path)
+        self._labels = None
+        self.labels_path = None
+        self._info = None
+
+    @property
+    def anchors_path(self):
+        anchors = self.metadata.get('anchors')
+        return os.path.join(self.folder, anchors) if anchors else None
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = self._find_labels()
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels):
+        self._labels = list(labels)
+
+    def _find_labels(self):
+        labels = self.metadata.get('labels')
+        if isinstance(labels, list):
+            self.labels_path = self.stem + '.json'
+            return labels
+        candidates = [labels] if isinstance(labels, str) else [self.stem + '-labels.txt']
+        prefixed = [f for f in self.label_files
+                    if f.endswith('-labels.txt') and self.stem.startswith(f[:-len('-labels.txt')])]
+        candidates += sorted(prefixed, key=len, reverse=True)
+        for name in candidates:
+            path = os.path.join(self.folder, name)
+            if os.path.exists(path):
+                self.labels_path = name
+                return read_labels(path)
+        generic = [f for f in self.label_files if not f.endswith('-labels.txt')]
+        classes = self.info()['classes']
+        for name in generic:
+            labels = read_labels(os.path.join(self.folder, name))
+            if (classes is None and len(generic) == 1) or len(labels) == classes:
+                self.labels_path = name
+                return labels
+        return []
+
+    def info(self):
+        # Tensor layout, read once on demand: allocating tensors takes a moment
+        if self._info is None:
+            interpreter = tflite.Interpreter(model_path=self.path)
+            interpreter.allocate_tensors()
+            detail = interpreter.get_input_details()[0]
+            outputs = interpreter.get_output_details()
+            try:
+                kind = model_kind(outputs)
+            except ValueError:
+                kind = 'unknown'
+            shapes = [[int(v) for v in d['shape']] for d in outputs]
+            classes = {'classifier': shapes[0][-1], 'fomo': shapes[0][-1]}.get(kind)
+            self._info = {'kind': kind, 'input_shape': [int(v) for v in detail['shape']],
+                          'input_dtype': np.dtype(detail['dtype']).name, 'output_shapes': shapes,
+                          'classes': classes}
+        return self._info
+
+    def describe(self):
+        return dict(self.info(), name=self.name, path=self.path, file_bytes=os.path.getsize(self.path),
+                    labels=len(self.labels), labels_file=self.labels_path,
+                    description=self.metadata.get('description'))
+
+
+def model_entry(path):
+    # A ModelEntry for any model file, with the labels files of its folder
+    folder = os.path.dirname(os.path.abspath(path))
+    return ModelEntry(path, sorted(f for f in os.listdir(folder) if f.endswith('.txt')))
+
+
+class ModelRegistry:
+    """Models found in one or more folders, loaded on demand and kept in an LRU.
+
+    ``entry(name)`` only knows models found by ``scan`` (by file name, or by
+    a path to one of them) and those registered by a successful load.
+    ``load(name)`` returns ``(entry, loader(entry))``, from the cache when the
+    model was loaded before, so switching back is instant. Each load is
+    charged the growth of the process's resident memory it caused (at least
+    the file size); past ``max_bytes`` the least recently used models are
+    handed to ``close`` and dropped, except those named in ``keep``.
+    """
+
+    def __init__(self, folders, loader, close=None, max_bytes=256 * 1024 * 1024):
+        self.folders = list(folders)
+        self.loader = loader
+        self.close = close
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()  # one load at a time keeps the memory accounting honest
+        self.entries = OrderedDict()
+        self.loaded = OrderedDict()  # name -> (value, bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.scan()
+
+    def scan(self):
+        # Picks up models added to the folders since the last scan
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                continue
+            files = sorted(os.listdir(folder))
+            label_files = [f for f in files if f.endswith('.txt')]
+            for f in files:
+                if f.endswith(MODEL_EXTENSIONS) and f not in self.entries:
+                    self.entries[f] = ModelEntry(os.path.join(folder, f), label_files)
+        return list(self.entries)
+
+    def entry(self, name):
+        # By file name, or by the path of a model the registry already knows
+        if name in self.entries:
+            return self.entries[name]
+        path = os.path.abspath(name)
+        for entry in self.entries.values():
+            if entry.path == path:
+                return entry
+        raise KeyError(name)
+
+    def load(self, name, keep=()):
+        # name as for entry(), or the path of a model outside the folders
+        # (e.g. given on the command line), registered once it has loaded
+        try:
+            entry = self.entry(name)
+        except KeyError:
+            if not (name.endswith(MODEL_EXTENSIONS) and os.path.isfile(name)):
+                raise
+            entry = model_entry(name)
+        with self.lock:
+            if entry.name in self.loaded:
+                self.loaded.move_to_end(entry.name)
+                self.hits += 1
+                return entry, self.loaded[entry.name][0]
+            self.misses += 1
+            before = resident_bytes()
+            value = self.loader(entry)
+            after = resident_bytes()
+            self.entries[entry.name] = entry
+            # Freed memory is rarely returned to the OS, so the RSS growth can
+            # undercount; never charge less than the weights themselves
+            grown = after - before if before is not None and after is not None else 0
+            self.loaded[entry.name] = (value, max(grown, os.path.getsize(entry.path)))
+            self._evict(set(keep) | {entry.name})
+            return entry, value
+
+    def _evict(self, keep):
+        for name in list(self.loaded):
+            if self.loaded_bytes() <= self.max_bytes:
+                break
+            if name in keep:
+                continue
+            value, _ = self.loaded.pop(name)
+            self.evictions += 1
+            if self.close:
+                self.close(value)
+
+    def loaded_bytes(self):
+        return sum(size for _, size in self.loaded.values())
+
+    def stats(self):
+        return {'loaded': list(self.loaded), 'loaded_bytes': self.loaded_bytes(), 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def describe(self):
+        models = []
+        for name, entry in self.entries.items():
+            try:
+                info = entry.describe()
+            except Exception as e:  # unreadable or unsupported file: list it, don't fail
+                info = {'name': name, 'path': entry.path, 'error': str(e)}
+            info['loaded_bytes'] = self.loaded[name][1] if name in self.loaded else None
+            models.append(info)
+        return models
@@ -0,0 +1,198 @@
+import json
+import os
+import numpy as np
+from PIL import Image
+import tflite_runtime.interpreter as tflite
+
+
+def tensor_order(detail):
+    # "StatefulPartitionedCall:2" -> 2, "TFLite_Detection_PostProcess" -> 0
+    name = detail['name']
+    suffix = name.rsplit(':', 1)[-1] if ':' in name else '0'
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def read_sidecar(model_path):
+    # Metadata from <stem>.json next to the model, {} when there is none
+    sidecar = os.path.splitext(model_path)[0] + '.json'
+    if not os.path.exists(sidecar):
+        return {}
+    with open(sidecar, 'r') as f:
+        return json.load(f)
+
+
+def quantized_range(dtype, quantization):
+    # Real input range implied by the quantization: [0, 1] or [-1, 1]
+    scale, zero_point = quantization
+    if np.dtype(dtype).kind not in 'iu' or not scale:
+        return None
+    info = np.iinfo(dtype)
+    low = (info.min - zero_point) * scale
+    return (0.0, 1.0) if low > -0.5 else (-1.0, 1.0)
+
+
+def input_lut(dtype, quantization, value_range):
+    # Pixel value 0..255 -> exact input tensor value, normalized and quantized
+    if value_range is None:
+        return np.arange(256).astype(dtype)
+    low, high = value_range
+    real = low + np.arange(256, dtype=np.float64) * ((high - low) / 255.0)
+    if np.dtype(dtype).kind == 'f':
+        return real.astype(dtype)
+    scale, zero_point = quantization
+    info = np.iinfo(dtype)
+    return np.clip(np.round(real / scale) + zero_point, info.min, info.max).astype(dtype)
+
+
+def model_kind(output_details):
+    shapes = [tuple(d['shape']) for d in output_details]
+    if len(shapes) == 4 and any(len(s) == 3 and s[-1] == 4 for s in shapes):
+        return 'ssd'
+    if len(shapes) == 2 and all(len(s) == 3 for s in shapes) and shapes[0][1] == shapes[1][1]:
+        return 'ssd_raw'  # box encodings and class scores per anchor, no NMS op
+    if len(shapes) == 1 and len(shapes[0]) == 4:
+        return 'fomo'
+    if len(shapes) == 1 and len(shapes[0]) == 2:
+        return 'classifier'
+    raise ValueError(f"Unsupported model outputs: {shapes}")
+
+
+class ModelRunner:
+    """A TFLite model with its tensor metadata resolved once at load time.
+
+    Input pixels are written straight into the interpreter's input buffer and
+    outputs are returned as views of the interpreter's own memory. Views are
+    only valid until the next ``invoke()``: copy anything you want to keep.
+    """
+
+    def __init__(self, model_path, num_threads=None, delegates=None, use_xnnpack=True,
+                 input_range=None):
+        self.model_path = model_path
+        # XNNPACK is the runtime's default CPU delegate; it can be switched off
+        resolver = (tflite.OpResolverType.AUTO if use_xnnpack
+                    else tflite.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+        self.interpreter = tflite.Interpreter(model_path=model_path,
+                                              num_threads=num_threads,
+                                              experimental_delegates=delegates,
+                                              experimental_op_resolver_type=resolver)
+        self.interpreter.allocate_tensors()
+
+        input_detail = self.interpreter.get_input_details()[0]
+        self.input_index = input_detail['index']
+        self.input_shape = tuple(input_detail['shape'])
+        self.input_dtype = input_detail['dtype']
+        self.input_quantization = input_detail['quantization']
+        self.batch_size = int(self.input_shape[0])
+        self.height, self.width = int(self.input_shape[1]), int(self.input_shape[2])
+        self._input = self.interpreter.tensor(self.input_index)
+        # input_range: real values the model was trained on, e.g. (0.0, 1.0);
+        # read from the input quantization when the model is quantized, else
+        # from "input_range" in the model's .json sidecar, else [-1, 1]
+        if input_range is None:
+            input_range = quantized_range(self.input_dtype, self.input_quantization)
+        if input_range is None and np.dtype(self.input_dtype).kind == 'f':
+            low, high = read_sidecar(model_path).get('input_range', (-1.0, 1.0))
+            input_range = (float(low), float(high))
+        self.input_range = input_range
+        self.input_lut = input_lut(self.input_dtype, self.input_quantization, input_range)
+        self._identity_input = (self.input_lut.dtype == np.uint8
+                                and np.array_equal(self.input_lut, np.arange(256)))
+
+        self.output_details = self.interpreter.get_output_details()
+        self.output_quantization = [d['quantization'] for d in self.output_details]
+        self._outputs = [self.interpreter.tensor(d['index']) for d in self.output_details]
+        self.kind = model_kind(self.output_details)
+        if self.kind == 'ssd':
+            self.ssd_indices = self._resolve_ssd_outputs()
+
+    @property
+    def input_size(self):
+        return self.width, self.height
+
+    def _resolve_ssd_outputs(self):
+        # Boxes are the only 3-D tensor and the count has a single element.
+        # The two [1, N] tensors are classes and scores, whose order depends
+        # on the exporter: TF1 post-processing emits boxes, classes, scores,
+        # count, while TF2 exports emit count, scores, classes, boxes.
+        details = self.output_details
+        order = sorted(range(len(details)), key=lambda i: tensor_order(details[i]))
+        boxes = next(i for i in order if len(details[i]['shape']) == 3)
+        count = next(i for i in order if np.prod(details[i]['shape']) == 1)
+        pair = [i for i in order if i not in (boxes, count)]
+        if order.index(boxes) < order.index(pair[0]):
+            classes, scores = pair
+        else:
+            scores, classes = pair
+        return boxes, classes, scores, count
+
+    def set_batch_size(self, batch_size):
+        # Resize the input batch dimension; returns False if the model refuses
+        if batch_size == self.batch_size:
+            return True
+        shape = [batch_size, self.height, self.width, self.input_shape[3]]
+        try:
+            self.interpreter.resize_tensor_input(self.input_index, shape)
+            self.interpreter.allocate_tensors()
+        except (RuntimeError, ValueError):
+            self.interpreter.resize_tensor_input(self.input_index, list(self.input_shape))
+            self.interpreter.allocate_tensors()
+            return False
+        self.batch_size = batch_size
+        self.input_shape = tuple(shape)
+        return True
+
+    def prepare(self, img):
+        # PIL image or HxWx3 uint8 array -> uint8 array at the model input size
+        if isinstance(img, np.ndarray):
+            if img.shape[:2] == (self.height, self.width):
+                return img
+            img = Image.fromarray(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != self.input_size:
+            img = img.resize(self.input_size)
+        return np.asarray(img)
+
+    def set_input(self, img, batch_index=0):
+        # One pass through the lookup table normalizes and quantizes straight
+        # into the input tensor, no intermediate float image
+        pixels = self.prepare(img)
+        view = self._input()[batch_index]
+        if self._identity_input:
+            np.copyto(view, pixels)
+        else:
+            np.take(self.input_lut, pixels, out=view, mode='clip')
+
+    def invoke(self):
+        self.interpreter.invoke()
+
+    def run(self, img):
+        self.set_input(img)
+        self.interpreter.invoke()
+
+    def output(self, i=0):
+        # Raw view of output i without the batch dimension; drop it before
+        # the next invoke(), the interpreter refuses to run while it is alive
+        return self._outputs[i]()[0]
+
+    def dequantized(self, i=0):
+        # Float copy of output i
+        return self._dequantize(self.output(i), i)
+
+    def _dequantize(self, raw, i):
+        scale, zero_point = self.output_quantization[i]
+        if raw.dtype in (np.int8, np.uint8) and scale:
+            return (raw.astype(np.float32) - zero_point) * scale
+        return raw.astype(np.float32)
+
+    def classify(self, img):
+        self.run(img)
+        return self.dequantized(0)
+
+    def classify_batch(self, imgs):
+        # Up to batch_size images per invoke(); one row of scores per image
+        for batch_index, img in enumerate(imgs):
+            self.set_input(img, batch_index)
+        self.interpreter.invoke()
+        return self._dequantize(self._outputs[0]()[:len(imgs)], 0)
+
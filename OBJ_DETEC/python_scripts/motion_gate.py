@@ -0,0 +1,69 @@
+import time
+import numpy as np
+
+
+class MotionGate:
+    """Skips inference on frames that look like the previous ones.
+
+    Frames are reduced to a small grayscale thumbnail by strided sampling and
+    compared with a running background (exponential moving average). If the
+    fraction of changed pixels stays under ``threshold`` the caller reuses its
+    last result; a refresh is forced every ``refresh_seconds`` regardless.
+    """
+
+    def __init__(self, threshold=0.02, pixel_delta=12, step=8, alpha=0.1,
+                 refresh_seconds=5.0, enabled=True):
+        self.threshold = threshold        # fraction of thumbnail pixels that must change
+        self.pixel_delta = pixel_delta    # gray level difference that counts as a change
+        self.step = step                  # sample every step-th pixel in both directions
+        self.alpha = alpha                # background adaptation rate
+        self.refresh_seconds = refresh_seconds
+        self.enabled = enabled
+        self.background = None
+        self.last_run = 0.0
+        self.last_change = 0.0
+        self.checked = 0
+        self.skipped = 0
+        self.inference_seconds = 0.0
+        self.inferred = 0
+
+    def thumbnail(self, frame):
+        small = frame[::self.step, ::self.step].astype(np.uint16)
+        # Integer luma approximation, no float image needed
+        return (small[:, :, 0] * 77 + small[:, :, 1] * 150 + small[:, :, 2] * 29) >> 8
+
+    def should_run(self, frame):
+        self.checked += 1
+        gray = self.thumbnail(frame)
+        now = time.monotonic()
+        if self.background is None or not self.enabled:
+            self.background = gray.astype(np.float32)
+            self.last_run = now
+            return True
+        changed = np.abs(gray - self.background) > self.pixel_delta
+        self.last_change = float(np.count_nonzero(changed)) / changed.size
+        self.background += self.alpha * (gray - self.background)
+        if self.last_change >= self.threshold or now - self.last_run >= self.refresh_seconds:
+            self.last_run = now
+            return True
+        self.skipped += 1
+        return False
+
+    def record_inference(self, seconds):
+        # Feeds the estimate of CPU time saved by skipped frames
+        self.inferred += 1
+        self.inference_seconds += seconds
+
+    def stats(self):
+        mean_inference = self.inference_seconds / self.inferred if self.inferred else 0.0
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'pixel_delta': self.pixel_delta,
+            'refresh_seconds': self.refresh_seconds,
+            'last_change': round(self.last_change, 4),
+            'frames_checked': self.checked,
+            'frames_skipped': self.skipped,
+            'skip_ratio': round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            'cpu_seconds_saved': round(self.skipped * mean_inference, 2),
+        }
@@ -1,173 +1,267 @@
 from flask import Flask, Response, render_template_string, request, jsonify
-from picamera2 import Picamera2
 import io
+import argparse
 import threading
 import time
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import tflite_runtime.interpreter as tflite
-from queue import Queue, Empty
+from PIL import Image
+from queue import Queue
+from collections import deque, namedtuple
+from concurrent.futures import wait
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 import os
 import signal
+from frame_buffer import FrameRingBuffer, make_source
+from mjpeg_broadcast import FrameBroadcaster
+from overlay import OverlayRenderer, overlay_payload
+from interpreter_pool import build_pool
+from model_registry import ModelRegistry, read_labels
+from metrics import PipelineMetrics
+from event_stream import ResultChannel, last_event_id
+from motion_gate import MotionGate
+from startup import Startup, wait_for_first_frame
+from tracker import BoxTracker
+from detection_decoders import make_decoder
+
+try:
+    from picamera2 import Picamera2
+except ImportError:  # lets --source synthetic / image folders run without a camera
+    Picamera2 = None
 
 app = Flask(__name__)
 
 # Global variables
+startup = Startup()
 picam2 = None
-frame = None
-frame_lock = threading.Lock()
+frame_size = (640, 480)
+frame_buffer = FrameRingBuffer(*frame_size)
+frame_source = None
+metrics = PipelineMetrics()
+broadcaster = FrameBroadcaster(bytes_counter=metrics.mjpeg_bytes)
+overlay_mode = "client"  # "client": boxes drawn by the browser, "server": burnt into the stream
+overlay_renderer = None
 is_detecting = False
 confidence_threshold = 0.5
 model_path = "./models/ssd-mobilenet-v1-tflite-default-v1.tflite"
-labels_path = "./models/coco_labels.txt"
-interpreter = None
+anchors_path = None  # .npy anchors for raw SSD models that do not use the default ones
+labels_override = None  # --labels, for the --model model only
+registry = None  # every model in --models-dir, loaded ones kept in an LRU
+# Everything the worker needs from the active model, replaced as a whole on a
+# switch so a frame never meets the new pool with the old decoder or labels
+ModelState = namedtuple('ModelState', 'entry pool strategy report decoder labels')
+model_state = None
+model_lock = threading.Lock()
+pool_config = {'strategy': 'auto', 'size': None, 'num_threads': None,
+               'use_xnnpack': True, 'delegate_path': None}
 detection_queue = Queue(maxsize=1)
 latest_detections = []
+latest_detections_seq = -1
 detections_lock = threading.Lock()
+in_flight = deque()
+results = ResultChannel()
+motion_gate = MotionGate()
+tracker = BoxTracker(*frame_size)
+detect_every = 1          # run the detector every N frames, the tracker fills the gaps
+detect_requested = False  # set by /detect_now to force a detector run on the next frame
 
-def load_labels(path):
-    with open(path, 'r') as f:
-        return {i: line.strip() for i, line in enumerate(f.readlines())}
-
-labels = load_labels(labels_path)
+metrics.watch('mjpeg_clients', 'Connected MJPEG viewers', lambda: broadcaster.clients)
+metrics.watch('inference_queue_depth', 'Frames submitted for inference and not yet post-processed',
+              lambda: len(in_flight))
+metrics.watch('motion_gate_skip_ratio', 'Fraction of frames skipped as unchanged',
+              lambda: motion_gate.stats()['skip_ratio'])
+metrics.watch('motion_gate_cpu_seconds_saved', 'Estimated inference time saved by skipping frames',
+              lambda: motion_gate.stats()['cpu_seconds_saved'])
+metrics.frames_tracked = metrics.registry.counter('frames_tracked_total',
+                                                  'Frames whose boxes came from the tracker only')
+metrics.watch('active_tracks', 'Objects currently tracked', lambda: len(tracker.tracks))
 
 def initialize_camera():
     global picam2
     picam2 = Picamera2()
-    config = picam2.create_preview_configuration(main={"size": (640, 480)})
+    config = picam2.create_preview_configuration(main={"size": frame_size, "format": "RGB888"})
     picam2.configure(config)
     picam2.start()
-    time.sleep(2)  # Wait for camera to warm up
+    return {'first_frame_seconds': round(wait_for_first_frame(picam2), 3)}
 
 def get_frame():
-    global frame
     while True:
-        stream = io.BytesIO()
-        picam2.capture_file(stream, format='jpeg')
-        stream.seek(0)
-        img = Image.open(stream)
-        
-        # Draw detections on the image
-        img_with_detections = draw_detections(img)
-        
-        # Convert the image back to bytes
-        img_byte_arr = io.BytesIO()
-        img_with_detections.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-
-        with frame_lock:
-            frame = img_byte_arr
-        print("Frame captured and processed")
+        slot = frame_buffer.next_slot()
+        with metrics.stage['capture'].time():
+            frame_source.read_into(slot)
+        seq = frame_buffer.commit()
+        metrics.frames_captured.inc()
+        metrics.capture_rate.mark()
+
+        # Only encode while someone is watching the stream
+        if broadcaster.has_viewers():
+            with metrics.stage['encode'].time():
+                jpeg = encode_frame(slot)
+            broadcaster.publish(jpeg, seq)
         time.sleep(0.1)  # Capture frames more frequently
 
-def generate_frames():
-    while True:
-        with frame_lock:
-            if frame is not None:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.03)  # Adjust this value to control frame rate
-
-def load_model():
-    global interpreter
-    if interpreter is None:
-        interpreter = tflite.Interpreter(model_path=model_path)
-        interpreter.allocate_tensors()
-    return interpreter
-
-def detect_objects(img, interpreter):
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-
-    # Get the expected input shape
-    input_shape = input_details[0]['shape']
-    height, width = input_shape[1], input_shape[2]
-
-    # Resize and preprocess the image
-    img = img.resize((width, height))
-    img = img.convert('RGB')  # Ensure the image is in RGB format
-    input_data = np.expand_dims(np.array(img, dtype=np.uint8), axis=0)
-
-    # Check if the model expects float input
-    if input_details[0]['dtype'] == np.float32:
-        input_data = (np.float32(input_data) - 127.5) / 127.5
-
-    # Set the tensor
-    interpreter.set_tensor(input_details[0]['index'], input_data)
-
-    # Run inference
-    interpreter.invoke()
-
-    # Get outputs
-    boxes = interpreter.get_tensor(output_details[0]['index'])[0]
-    classes = interpreter.get_tensor(output_details[1]['index'])[0]
-    scores = interpreter.get_tensor(output_details[2]['index'])[0]
-    num_detections = int(interpreter.get_tensor(output_details[3]['index'])[0])
-
-    return boxes, classes, scores, num_detections
+def encode_frame(raw):
+    detections = []
+    if overlay_mode == "server" and is_detecting:
+        with detections_lock:
+            detections = latest_detections
+    if detections:
+        return overlay_renderer.encode(raw, detections)
+    img_byte_arr = io.BytesIO()
+    Image.fromarray(raw).save(img_byte_arr, format='JPEG')
+    return img_byte_arr.getvalue()
+
+def build_model(entry):
+    # Registry loader: a warmed-up interpreter pool and the decoder for its outputs.
+    # --anchors and --labels belong to the --model model; others name theirs in a .json sidecar
+    pool, strategy, report = build_pool(entry.path, **pool_config)
+    is_cli_model = entry.path == os.path.abspath(model_path)
+    if labels_override and is_cli_model:
+        entry.labels = labels_override
+    path = entry.anchors_path
+    if path is None and anchors_path and is_cli_model:
+        path = anchors_path
+    pool.warm_up()
+    return pool, strategy, report, make_decoder(pool.runner, np.load(path) if path else None)
+
+def close_model(built):
+    built[0].close()
+
+def load_model(name=None):
+    # The active model's state; with a name, switch to that model first. The
+    # camera keeps running: the worker submits the next frame to the new pool
+    global model_state, detect_requested
+    with model_lock:
+        if model_state is not None and (name is None or registry.entry(name) is model_state.entry):
+            return model_state
+        # Frames may still be in flight on the old pool, so it stays loaded
+        keep = [model_state.entry.name] if model_state else []
+        entry, (pool, strategy, report, decoder) = registry.load(name or model_path, keep)
+        model_state = ModelState(entry, pool, strategy, report, decoder, dict(enumerate(entry.labels)))
+        # Boxes of the old model mean nothing to the new one: the worker
+        # drops its tracks when it sees the new state and detects right away
+        motion_gate.background = None
+        detect_requested = True
+        print(f"Model: {entry.name}, outputs: {pool.runner.kind} ({type(decoder).__name__})")
+        print(f"Inference strategy: {strategy} ({pool.size} x {pool.num_threads} threads)")
+        for candidate, result in report.items():
+            print(f"  {candidate}: {result['fps']} fps")
+        return model_state
+
+def prepare_model():
+    # Startup phase: load (and pick a strategy) and warm up every interpreter
+    start = time.perf_counter()
+    load_model()
+    return {'model': model_state.entry.name, 'load_seconds': round(time.perf_counter() - start, 3)}
+
+def build_detections(boxes, class_ids, scores, width, height, labels):
+    # Decoded boxes are normalized [left, top, right, bottom], already thresholded
+    pixel_boxes = (boxes * np.array([width, height, width, height], dtype=np.float32)).tolist()
+    return [{'class': labels.get(class_id, f"Class {class_id}"), 'score': score, 'box': box}
+            for box, class_id, score in zip(pixel_boxes, class_ids.tolist(), scores.tolist())]
+
+def detect_frame(runner, raw, seq, decoder):
+    # Runs on an interpreter pool thread; decoder is the one of the runner's
+    # model. The frame is copied into the input tensor first; if capture has
+    # reused its slot meanwhile the copy may be torn, so the frame is dropped
+    # before paying for invoke()
+    with metrics.stage['preprocess'].time():
+        runner.set_input(raw)
+    if not frame_buffer.is_valid(seq):
+        return None, 0.0
+    start = time.perf_counter()
+    runner.invoke()
+    outputs = decoder(runner, confidence_threshold)
+    inference_seconds = time.perf_counter() - start
+    metrics.stage['inference'].observe(inference_seconds)
+    metrics.frames_inferred.inc()
+    metrics.inference_rate.mark()
+    return outputs, inference_seconds
+
+def publish_detections(detections, seq):
+    global latest_detections, latest_detections_seq
+    with detections_lock:
+        latest_detections = detections  # Replace instead of append
+        latest_detections_seq = seq
+    results.publish(overlay_payload(detections, seq, *frame_size))
+
+def discard_in_flight():
+    # On /stop: frames still running belong to the old run; let them finish
+    # (or never start) and forget them, so a later /start shows only new results
+    futures = [future for _, future, _ in in_flight]
+    in_flight.clear()
+    for future in futures:
+        future.cancel()
+    wait(futures)
 
 def detection_worker():
-    global frame, is_detecting, latest_detections
-    interpreter = load_model()
+    global detect_requested
+    tracked_state = load_model()
     print("Model loaded successfully")
+    last_seq = -1
+    last_detect_seq = -1
+    width, height = frame_size
 
     while True:
-        if is_detecting:
-            try:
-                current_frame = None
-                with frame_lock:
-                    if frame is not None:
-                        current_frame = frame
-
-                if current_frame is not None:
-                    img = Image.open(io.BytesIO(current_frame))
-                    
-                    boxes, classes, scores, num_detections = detect_objects(img, interpreter)
-                    
-                    new_detections = []
-                    for i in range(int(num_detections)):
-                        if scores[i] >= confidence_threshold:
-                            ymin, xmin, ymax, xmax = boxes[i]
-                            (left, right, top, bottom) = (xmin * img.width, xmax * img.width, 
-                                                          ymin * img.height, ymax * img.height)
-                            
-                            class_id = int(classes[i])
-                            class_name = labels.get(class_id, f"Class {class_id}")
-                            
-                            new_detections.append({
-                                'class': class_name,
-                                'score': float(scores[i]),
-                                'box': [left, top, right, bottom]
-                            })
-                    
-                    with detections_lock:
-                        latest_detections = new_detections  # Replace instead of append
-
-            except Exception as e:
-                print(f"Error in detection worker: {e}")
-                import traceback
-                traceback.print_exc()
-        time.sleep(0.1)  # Process frames more frequently
-
-def draw_detections(img):
-    draw = ImageDraw.Draw(img)
-    try:
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 12)
-    except IOError:
-        font = ImageFont.load_default()
+        if not is_detecting:
+            last_seq = -1
+            discard_in_flight()
+            last_detect_seq = -1
+            tracker.reset()
+            time.sleep(0.1)
+            continue
+        state = model_state  # read once: a switch mid-frame must not mix two models
+        if state is not tracked_state:
+            tracked_state = state
+            tracker.reset()
+        try:
+            seq, raw = frame_buffer.wait_for(last_seq, timeout=0.01 if in_flight else 0.5)
+            if raw is not None and seq != last_seq:
+                if last_seq >= 0 and seq > last_seq + 1:
+                    metrics.frames_dropped.inc(seq - last_seq - 1)
+                last_seq = seq
+                due = (detect_every <= 1 or detect_requested or last_detect_seq < 0
+                       or seq - last_detect_seq >= detect_every)
+                # Unchanged scene: keep the last detections
+                if due and motion_gate.should_run(raw):
+                    detect_requested = False
+                    last_detect_seq = seq
+                    in_flight.append((seq, state.pool.submit(detect_frame, raw, seq, state.decoder), state))
+                elif detect_every > 1 and tracker.tracks:
+                    # Between detector runs the tracker moves the boxes along;
+                    # a run the motion gate skipped leaves them where they are
+                    if due:
+                        tracker.hold(seq)
+                    publish_detections(tracker.predict(seq), seq)
+                    metrics.frames_tracked.inc()
+            # Post-process finished frames in order while later ones are still running
+            while is_detecting and in_flight and (in_flight[0][1].done() or len(in_flight) >= state.pool.size):
+                frame_seq, future, frame_state = in_flight.popleft()
+                outputs, inference_seconds = future.result()
+                if outputs is None:
+                    metrics.frames_dropped.inc()
+                    continue  # capture thread overwrote the slot before inference
+                if frame_state is not state:
+                    continue  # detected by the model before a switch; the tracker has moved on
+                motion_gate.record_inference(inference_seconds)
+                boxes, class_ids, scores = outputs
+                new_detections = build_detections(boxes, class_ids, scores, width, height, state.labels)
+                if detect_every <= 1:
+                    # Detector on every frame: its boxes go out as they are
+                    tracker.reset()
+                    publish_detections(new_detections, frame_seq)
+                    continue
+                # Report boxes at the newest frame so late results do not lag behind
+                tracker.update(new_detections, frame_seq)
+                shown_seq = max(frame_seq, last_seq)
+                publish_detections(tracker.predict(shown_seq), shown_seq)
 
-    with detections_lock:
-        for detection in latest_detections:
-            left, top, right, bottom = detection['box']
-            draw.rectangle([left, top, right, bottom], outline="red", width=2)
-            
-            label = f"{detection['class']}: {detection['score']:.2f}"
-            draw.text((left, top-15), label, font=font, fill="red")
+        except Exception as e:
+            print(f"Error in detection worker: {e}")
+            import traceback
+            traceback.print_exc()
+            time.sleep(0.1)
 
-    return img
-        
 @app.route('/')
 def index():
     return render_template_string('''
@@ -194,14 +288,33 @@ def index():
                 $.post('/update_confidence', {confidence: confidence});
             }
         
-            function updateDetections() {
-                $.get('/get_detections', function(data) {
-                    $('#detections').empty();
-                    const stableDetections = data.sort((a, b) => b.score - a.score);
+            function drawOverlay(data) {
+                const canvas = document.getElementById('overlay');
+                const ctx = canvas.getContext('2d');
+                const sx = canvas.width / data.size[0];
+                const sy = canvas.height / data.size[1];
+                ctx.clearRect(0, 0, canvas.width, canvas.height);
+                ctx.strokeStyle = 'red';
+                ctx.fillStyle = 'red';
+                ctx.lineWidth = 2;
+                ctx.font = 'bold 12px sans-serif';
+                data.boxes.forEach(b => {
+                    ctx.strokeRect(b[0] * sx, b[1] * sy, (b[2] - b[0]) * sx, (b[3] - b[1]) * sy);
+                    ctx.fillText(boxLabel(b), b[0] * sx, b[1] * sy - 3);
+                });
+            }
+
+            function boxLabel(b) {
+                const label = `${b[4]}: ${b[5].toFixed(2)}`;
+                return b[6] == null ? label : `#${b[6]} ${label}`;
+            }
         
-                    stableDetections.forEach(detection => {
-                        $('#detections').append(`<p>${detection.class}: ${detection.score.toFixed(2)}</p>`);
-                    });
+            function showDetections(data) {
+                $('#detections').empty();
+                const stableDetections = data.boxes.slice().sort((a, b) => b[5] - a[5]);
+        
+                stableDetections.forEach(b => {
+                    $('#detections').append(`<p>${boxLabel(b)}</p>`);
                 });
             }
         
@@ -225,15 +338,37 @@ def index():
                 }
             }
         
+            function switchModel() {
+                $('#model').prop('disabled', true);
+                $.post('/models/active', {name: $('#model').val()})
+                    .always(function() { $('#model').prop('disabled', false); });
+            }
+
             $(document).ready(function() {
-                setInterval(updateDetections, 500);  // Update every 500ms
+                $.getJSON('/models', function(data) {
+                    data.models.forEach(m => $('#model').append(new Option(m.name, m.name)));
+                    $('#model').val(data.active);
+                });
+                // Each new result is pushed once over Server-Sent Events; EventSource
+                // reconnects by itself and resumes from the last event id it received
+                const source = new EventSource('/stream_detections');
+                source.onmessage = function(event) {
+                    const data = JSON.parse(event.data);
+                    showDetections(data);
+                    if ('{{ overlay_mode }}' === 'client') {
+                        drawOverlay(data);
+                    }
+                };
             });
         </script>
             
   </head>
         <body>
             <h1>Object Detection</h1>
-            <img src="{{ url_for('video_feed') }}" width="640" height="480" />
+            <div style="position: relative; width: 640px; height: 480px;">
+                <img src="{{ url_for('video_feed') }}" width="640" height="480" />
+                <canvas id="overlay" width="640" height="480" style="position: absolute; left: 0; top: 0;"></canvas>
+            </div>
             <br>
             <button id="startBtn" onclick="startDetection()">Start Detection</button>
             <button id="stopBtn" onclick="stopDetection()" disabled>Stop Detection</button>
@@ -242,14 +377,19 @@ def index():
             <label for="confidence">Confidence Threshold:</label>
             <input type="number" id="confidence" name="confidence" min="0" max="1" step="0.1" value="0.5" onchange="updateConfidence()">
             <br>
+            <label for="model">Model:</label>
+            <select id="model" onchange="switchModel()"></select>
+            <br>
             <div id="detections">Waiting for detections...</div>
         </body>
         </html>
-    ''')
+    ''', overlay_mode=overlay_mode)
     
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    # Optional per-client frame rate cap, e.g. /video_feed?fps=2
+    max_fps = request.args.get('fps', type=float)
+    return Response(broadcaster.stream(max_fps),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/start', methods=['POST'])
@@ -262,6 +402,7 @@ def start_detection():
 def stop_detection():
     global is_detecting
     is_detecting = False
+    results.publish(overlay_payload([], -1, *frame_size))
     return '', 204
 
 @app.route('/update_confidence', methods=['POST'])
@@ -278,6 +419,99 @@ def get_detections():
     with detections_lock:
         return jsonify(latest_detections)
 
+@app.route('/get_overlay')
+def get_overlay():
+    # Boxes for client-side drawing, tagged with the frame they were detected on
+    if not is_detecting:
+        return jsonify(overlay_payload([], -1, *frame_size))
+    with detections_lock:
+        return jsonify(overlay_payload(latest_detections, latest_detections_seq, *frame_size))
+
+@app.route('/motion_gate', methods=['GET', 'POST'])
+def motion_gate_settings():
+    # POST any of: enabled (0/1), threshold, pixel_delta, refresh_seconds
+    if request.method == 'POST':
+        if 'enabled' in request.form:
+            motion_gate.enabled = request.form['enabled'] in ('1', 'true', 'on')
+        for name in ('threshold', 'pixel_delta', 'refresh_seconds'):
+            if name in request.form:
+                setattr(motion_gate, name, float(request.form[name]))
+    return jsonify(motion_gate.stats())
+
+@app.route('/tracking', methods=['GET', 'POST'])
+def tracking_settings():
+    # POST detect_every=N (1 = detector on every frame) and/or iou_threshold, max_misses
+    global detect_every
+    if request.method == 'POST':
+        if 'detect_every' in request.form:
+            detect_every = max(int(request.form['detect_every']), 1)
+        if 'iou_threshold' in request.form:
+            tracker.iou_threshold = float(request.form['iou_threshold'])
+        if 'max_misses' in request.form:
+            tracker.max_misses = int(request.form['max_misses'])
+    return jsonify({'detect_every': detect_every, 'iou_threshold': tracker.iou_threshold,
+                    'max_misses': tracker.max_misses, 'active_tracks': len(tracker.tracks)})
+
+@app.route('/detect_now', methods=['POST'])
+def detect_now():
+    # Run the detector on the next frame regardless of detect_every
+    global detect_requested
+    detect_requested = True
+    return '', 204
+
+@app.route('/models')
+def list_models():
+    return jsonify({'active': model_state.entry.name if model_state else None,
+                    'models': registry.describe(), 'cache': registry.stats()})
+
+@app.route('/models/active', methods=['POST'])
+def switch_model():
+    # Form or JSON field "name": a model listed by /models
+    name = request.form.get('name') or (request.get_json(silent=True) or {}).get('name')
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    start = time.perf_counter()
+    try:
+        registry.entry(name)  # listed models only: load() would also take any path
+        load_model(name)
+    except KeyError:
+        return jsonify({'error': f"unknown model: {name}"}), 404
+    except (ValueError, RuntimeError, OSError) as e:
+        # Not a model the interpreter can run; the active one stays
+        return jsonify({'error': f"cannot load {name}: {e}"}), 400
+    state = model_state
+    return jsonify({'active': state.entry.name, 'kind': state.pool.runner.kind,
+                    'labels': state.entry.labels[:20],
+                    'switch_seconds': round(time.perf_counter() - start, 3), 'cache': registry.stats()})
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(startup.health()), 503 if startup.error else 200
+
+@app.route('/readyz')
+def readyz():
+    # 503 until the camera delivers frames and the model is loaded and warm
+    return jsonify(startup.readiness()), 200 if startup.ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/pool_stats')
+def pool_stats():
+    state = model_state
+    if state is None:
+        return jsonify({'strategy': None})
+    return jsonify({'strategy': state.strategy, 'pool_size': state.pool.size,
+                    'num_threads': state.pool.num_threads, 'achieved_fps': round(state.pool.fps(), 1),
+                    'candidates': state.report})
+
+@app.route('/stream_detections')
+def stream_detections():
+    # Server-Sent Events: one message per new result, tagged with its frame seq
+    return Response(results.stream(last_event_id(request)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
 @app.route('/close', methods=['POST'])
 def close_app():
     global is_detecting
@@ -296,17 +530,69 @@ def close_app():
 def cleanup():
     global picam2, is_detecting
     is_detecting = False
+    broadcaster.close()
+    results.close()
     if picam2:
         picam2.stop()
     # You might want to add any additional cleanup code here
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Live object detection")
+    parser.add_argument('--source', default='camera',
+                        help='"camera", "synthetic" or an image file/directory')
+    parser.add_argument('--model', default=model_path,
+                        help='SSD (with or without post-processing) or FOMO model: a file name in '
+                             '--models-dir or a path')
+    parser.add_argument('--models-dir', action='append',
+                        help='folder to offer models from (repeatable, default ./models)')
+    parser.add_argument('--model-cache-mb', type=float, default=256,
+                        help='memory for loaded models kept around for instant switching')
+    parser.add_argument('--labels', help='labels file for --model, one class per line (default: found '
+                        'next to the model, e.g. coco_labels.txt or <prefix>-labels.txt)')
+    parser.add_argument('--anchors', help='.npy anchors [cy, cx, h, w] for a raw SSD model')
+    parser.add_argument('--overlay', choices=['client', 'server'], default=overlay_mode,
+                        help='draw boxes in the browser or burn them into the MJPEG stream')
+    parser.add_argument('--strategy', default='auto', choices=['auto', 'intra-op', 'inter-frame', 'hybrid'],
+                        help='how to spread inference over the CPU cores')
+    parser.add_argument('--pool-size', type=int, help='number of interpreters')
+    parser.add_argument('--num-threads', type=int, help='threads per interpreter')
+    parser.add_argument('--no-xnnpack', action='store_true', help='disable the XNNPACK delegate')
+    parser.add_argument('--delegate', help='path to an external delegate library')
+    parser.add_argument('--motion-threshold', type=float, default=motion_gate.threshold,
+                        help='fraction of changed pixels that triggers inference')
+    parser.add_argument('--motion-refresh', type=float, default=motion_gate.refresh_seconds,
+                        help='seconds after which inference runs even on a static scene')
+    parser.add_argument('--no-motion-gate', action='store_true', help='run inference on every frame')
+    parser.add_argument('--detect-every', type=int, default=detect_every,
+                        help='run the detector every N frames and track boxes in between')
+    args = parser.parse_args()
+    detect_every = max(args.detect_every, 1)
+    model_path, anchors_path = args.model, args.anchors
+    registry = ModelRegistry(args.models_dir or ['./models'], build_model, close_model,
+                             int(args.model_cache_mb * 1024 * 1024))
+    if args.labels:
+        labels_override = read_labels(args.labels)
+    motion_gate.threshold = args.motion_threshold
+    motion_gate.refresh_seconds = args.motion_refresh
+    motion_gate.enabled = not args.no_motion_gate
+    pool_config.update(strategy=args.strategy, size=args.pool_size, num_threads=args.num_threads,
+                       use_xnnpack=not args.no_xnnpack, delegate_path=args.delegate)
+    overlay_mode = args.overlay
+    overlay_renderer = OverlayRenderer(*frame_size)
+
     try:
-        initialize_camera()
-        detection_thread = threading.Thread(target=detection_worker, daemon=True)
-        detection_thread.start()
-        frame_thread = threading.Thread(target=get_frame, daemon=True)
-        frame_thread.start()
+        def start_camera():
+            global frame_source
+            details = initialize_camera() if args.source == 'camera' else {}
+            frame_source = make_source(args.source, *frame_size, picam2=picam2)
+            return details
+
+        def start_workers():
+            threading.Thread(target=detection_worker, daemon=True).start()
+            threading.Thread(target=get_frame, daemon=True).start()
+
+        # Camera and model come up side by side while the server already answers
+        startup.run({'camera': start_camera, 'model': prepare_model}, then=start_workers)
         app.run(host='0.0.0.0', port=5000, threaded=True)
     except KeyboardInterrupt:
         print("Shutting down...")
@@ -0,0 +1,92 @@
+import io
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+
+def overlay_payload(detections, seq, width, height):
+    # Compact form sent to the browser: [left, top, right, bottom, class, score, track id]
+    return {
+        'seq': seq,
+        'size': [width, height],
+        'boxes': [[int(round(d['box'][0])), int(round(d['box'][1])),
+                   int(round(d['box'][2])), int(round(d['box'][3])),
+                   d['class'], round(d['score'], 3), d.get('track_id')] for d in detections],
+    }
+
+
+def detection_label(detection):
+    label = f"{detection['class']}: {detection['score']:.2f}"
+    if detection.get('track_id') is not None:
+        label = f"#{detection['track_id']} {label}"
+    return label
+
+
+class OverlayRenderer:
+    """Draws detection boxes and labels straight onto raw RGB frames.
+
+    The font is loaded once and every character is rasterised only the first
+    time it is seen; afterwards labels are composited from the cached glyph
+    masks with NumPy, so the capture loop never touches the font again.
+    """
+
+    def __init__(self, width, height, font_size=12, color=(255, 0, 0)):
+        try:
+            self.font = ImageFont.truetype(FONT_PATH, font_size)
+        except IOError:
+            self.font = ImageFont.load_default()
+        self.line_height = font_size + 4
+        self.color = np.array(color, dtype=np.uint8)
+        self.canvas = np.empty((height, width, 3), dtype=np.uint8)
+        self.glyphs = {}
+
+    def glyph(self, char):
+        cached = self.glyphs.get(char)
+        if cached is None:
+            advance = max(int(round(self.font.getlength(char))), 1)
+            img = Image.new('L', (advance, self.line_height))
+            ImageDraw.Draw(img).text((0, 0), char, font=self.font, fill=255)
+            cached = (np.array(img) > 127, advance)
+            self.glyphs[char] = cached
+        return cached
+
+    def paint(self, x, y, mask):
+        height, width = self.canvas.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mask.shape[1], width), min(y + mask.shape[0], height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = self.canvas[y0:y1, x0:x1]
+        region[mask[y0 - y:y1 - y, x0 - x:x1 - x]] = self.color
+
+    def draw_text(self, x, y, text):
+        for char in text:
+            mask, advance = self.glyph(char)
+            self.paint(x, y, mask)
+            x += advance
+
+    def draw_box(self, left, top, right, bottom, width=2):
+        height, frame_width = self.canvas.shape[:2]
+        left, right = max(left, 0), min(right, frame_width - 1)
+        top, bottom = max(top, 0), min(bottom, height - 1)
+        if left >= right or top >= bottom:
+            return
+        self.canvas[top:top + width, left:right + 1] = self.color
+        self.canvas[max(bottom - width + 1, top):bottom + 1, left:right + 1] = self.color
+        self.canvas[top:bottom + 1, left:left + width] = self.color
+        self.canvas[top:bottom + 1, max(right - width + 1, left):right + 1] = self.color
+
+    def render(self, frame, detections):
+        # Draw on a private copy so inference never sees the overlay
+        np.copyto(self.canvas, frame)
+        for detection in detections:
+            left, top, right, bottom = (int(v) for v in detection['box'])
+            self.draw_box(left, top, right, bottom)
+            self.draw_text(left, top - 15, detection_label(detection))
+        return self.canvas
+
+    def encode(self, frame, detections, quality=75):
+        stream = io.BytesIO()
+        Image.fromarray(self.render(frame, detections)).save(stream, format='JPEG', quality=quality)
+        return stream.getvalue()
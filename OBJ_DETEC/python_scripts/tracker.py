@@ -0,0 +1,129 @@
+import numpy as np
+
+
+def iou_matrix(a, b):
+    # Pairwise IoU of two (N, 4) and (M, 4) arrays of [left, top, right, bottom]
+    left = np.maximum(a[:, None, 0], b[None, :, 0])
+    top = np.maximum(a[:, None, 1], b[None, :, 1])
+    right = np.minimum(a[:, None, 2], b[None, :, 2])
+    bottom = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    def __init__(self, track_id, box, label, score, seq):
+        self.id = track_id
+        self.box = np.array(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)  # box change per frame
+        self.label = label
+        self.score = score
+        self.seq = seq      # frame the box was last corrected on
+        self.hits = 1
+        self.misses = 0
+
+    def predict(self, seq):
+        return self.box + self.velocity * (seq - self.seq)
+
+
+class BoxTracker:
+    """IoU matching plus a constant-velocity alpha-beta filter per box.
+
+    ``update`` takes detector output for a frame and matches it to the
+    existing tracks (same class, greedy by IoU). Matched tracks keep their id
+    and blend position and velocity towards the measurement; the others are
+    dropped after ``max_misses`` detector runs without a match. ``predict``
+    extrapolates every track to any later frame without running the model;
+    ``hold`` keeps the tracks in place when the frame is known to be unchanged.
+    Time is counted in frame sequence numbers, so dropped frames are fine.
+    """
+
+    def __init__(self, width, height, iou_threshold=0.3, alpha=0.6, beta=0.2,
+                 max_misses=2, max_coast=30):
+        self.width = width
+        self.height = height
+        self.iou_threshold = iou_threshold
+        self.alpha = alpha              # weight of the measured position
+        self.beta = beta                # weight of the measured velocity
+        self.max_misses = max_misses
+        self.max_coast = max_coast      # frames a box is extrapolated without a detection
+        self.tracks = []
+        self.next_id = 1
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, detections, seq):
+        boxes = np.array([d['box'] for d in detections], dtype=np.float32).reshape(-1, 4)
+        matched_tracks, matched_detections = set(), set()
+        if self.tracks and len(detections):
+            predicted = np.array([t.predict(seq) for t in self.tracks])
+            ious = iou_matrix(predicted, boxes)
+            same_class = (np.array([t.label for t in self.tracks])[:, None]
+                          == np.array([d['class'] for d in detections])[None, :])
+            ious[~same_class] = 0.0
+            # Greedy assignment, best overlap first
+            while True:
+                t, d = np.unravel_index(np.argmax(ious), ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                self.correct(self.tracks[t], predicted[t], boxes[d], detections[d]['score'], seq)
+                matched_tracks.add(t)
+                matched_detections.add(d)
+                ious[t, :] = 0.0
+                ious[:, d] = 0.0
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                survivors.append(Track(self.next_id, boxes[d], detection['class'],
+                                       detection['score'], seq))
+                self.next_id += 1
+        self.tracks = survivors
+        return self.predict(seq)
+
+    def correct(self, track, predicted, measured, score, seq):
+        frames = max(seq - track.seq, 1)
+        residual = measured - predicted
+        track.box = predicted + self.alpha * residual
+        track.velocity = track.velocity + self.beta * residual / frames
+        track.seq = seq
+        track.score = score
+        track.hits += 1
+        track.misses = 0
+
+    def hold(self, seq):
+        # The scene has not changed since the last detector run: every box
+        # stays where it was and counts as seen on frame seq, so tracks
+        # neither drift nor coast out while the detector is skipped
+        for track in self.tracks:
+            track.velocity[:] = 0.0
+            track.seq = seq
+
+    def predict(self, seq):
+        # Detections dicts for frame seq, each tagged with its track id
+        detections = []
+        for track in self.tracks:
+            if seq - track.seq > self.max_coast:
+                continue
+            left, top, right, bottom = track.predict(seq)
+            left, right = max(float(left), 0.0), min(float(right), float(self.width))
+            top, bottom = max(float(top), 0.0), min(float(bottom), float(self.height))
+            if right - left < 1 or bottom - top < 1:
+                continue
+            detections.append({
+                'class': track.label,
+                'score': float(track.score),
+                'box': [left, top, right, bottom],
+                'track_id': track.id,
+            })
+        return detections
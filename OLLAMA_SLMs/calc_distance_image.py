@@ -1,36 +1,30 @@
+import argparse
+import hashlib
+import io
+import json
+import os
 import sys
-from haversine import haversine
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import ollama
-from openai import OpenAI
-from pydantic import BaseModel, Field
-import instructor
+from pydantic import BaseModel, Field, ValidationError
+from PIL import Image, ImageOps
 import time
+from gazetteer import Gazetteer, distance_matrix
 
-start_time = time.perf_counter()  # Start timing
-
-img = sys.argv[1]
 MODEL = 'llava-phi3:3.8b'
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geo_cache.jsonl')
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_payloads')
+VISION_SIZE = 336  # llava-phi3's CLIP ViT-L/14-336 encoder sees 336x336 whatever we send
+JPEG_QUALITY = 90
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+PROMPT = 'return the decimal latitude and decimal longitude of the city in the image, its name, and what country it is located'
 mylat = -33.33
 mylon = -70.51
+MAX_CITY_DISTANCE_KM = 100  # LLM coordinates further than this from any known city are flagged
+NAME_MATCH_RADIUS_KM = 200  # a same-named city abroad only overrides the LLM this close to its point
 
-def image_description(img):
-    with open(img, 'rb') as file:
-        response = ollama.chat(
-            model=MODEL,
-            messages=[
-              {
-                'role': 'user',
-                'content': 'return the decimal latitude and decimal longitude of the city in the image, its name, and what country it is located',
-                'images': [file.read()],
-              },
-            ],
-            options = {
-              'temperature': 0,
-              }
-      )
-    #print(response['message']['content'])
-    return response['message']['content']
-    
 
 class CityCoord(BaseModel):
     city: str = Field(..., description="Name of the city in the image")
@@ -38,34 +32,379 @@ class CityCoord(BaseModel):
     lat: float = Field(..., description="Decimal Latitude of the city in the image")
     lon: float = Field(..., description="Decimal Longitude of the city in the image")
 
-# enables `response_model` in create call
-client = instructor.patch(
-    OpenAI(
-        base_url="http://localhost:11434/v1",
-        api_key="ollama",
-    ),
-    mode=instructor.Mode.JSON,
-)
-
-image_description = image_description(img)
-# Send this description to the model
-resp = client.chat.completions.create(
-    model=MODEL,
-    messages=[
-        {
-            "role": "user",
-            "content": image_description,
-        }
-    ],
-    response_model=CityCoord,
-    max_retries=10,
-    temperature=0,
-)
-
-distance = haversine((mylat, mylon), (resp.lat, resp.lon), unit='km')
-
-print(f"\n The image shows {resp.city}, with lat:{round(resp.lat, 2)} and long: {round(resp.lon, 2)}, located in {resp.country} and about {int(round(distance, -1)):,} kilometers away from Santiago, Chile.\n")
-
-end_time = time.perf_counter()  # End timing
-elapsed_time = end_time - start_time  # Calculate elapsed time
-print(f" [INFO] ==> The code (running {MODEL}), took {elapsed_time:.1f} seconds to execute.\n")
\ No newline at end of file
+
+class ResultCache:
+    """Answers by image content hash and model name, kept in a JSON lines file.
+
+    Lines are only ever appended, so an interrupted batch keeps everything it
+    finished; when a key appears twice the last line wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    self.entries[entry['key']] = entry['result']
+
+    @staticmethod
+    def key(image_bytes, model):
+        return f"{hashlib.sha256(image_bytes).hexdigest()}:{model}"
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'key': key, 'result': result}) + '\n')
+
+
+def shrink_image(image_bytes, max_side=VISION_SIZE, quality=JPEG_QUALITY):
+    # Longest side down to max_side, re-encoded as JPEG. The decoder's draft
+    # mode does most of the reduction in the DCT domain (1/2, 1/4 or 1/8
+    # scale), so a 12 MP photo is never fully decoded.
+    img = Image.open(io.BytesIO(image_bytes))
+    width, height = img.size
+    scale = max_side / max(width, height)
+    # Orientation 1 (or none) is already upright; any other needs a transpose
+    if scale >= 1 and img.format == 'JPEG' and img.getexif().get(0x0112, 1) == 1:
+        return image_bytes  # already small enough and upright
+    size = (max(1, round(width * scale)), max(1, round(height * scale))) if scale < 1 else img.size
+    img.draft('RGB', size)
+    img = ImageOps.exif_transpose(img.convert('RGB'))
+    if scale < 1:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+class PayloadCache:
+    """Shrunk images on disk, named by the original's hash and the settings.
+
+    A folder that is located again (another model, a new reference point, a
+    cleared result cache) skips decoding and re-encoding. Nothing is evicted;
+    the files are small and the folder can be deleted at any time.
+    """
+
+    def __init__(self, folder, max_side=VISION_SIZE, quality=JPEG_QUALITY):
+        self.folder = folder
+        self.max_side = max_side
+        self.quality = quality
+        os.makedirs(folder, exist_ok=True)
+
+    def get(self, image_bytes):
+        # (payload, seconds spent making it, from_cache)
+        start = time.perf_counter()
+        name = f"{hashlib.sha256(image_bytes).hexdigest()}_{self.max_side}_q{self.quality}.jpg"
+        path = os.path.join(self.folder, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read(), time.perf_counter() - start, True
+        payload = shrink_image(image_bytes, self.max_side, self.quality)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        return payload, time.perf_counter() - start, False
+
+
+def image_description(client, image_bytes, model):
+    response = client.chat(
+        model=model,
+        messages=[
+          {
+            'role': 'user',
+            'content': PROMPT,
+            'images': [image_bytes],
+          },
+        ],
+        options = {
+          'temperature': 0,
+          }
+    )
+    return response['message']['content']
+
+def locate_structured(client, image_bytes, model):
+    # One call: the JSON schema constrains llava's answer to a CityCoord
+    response = client.chat(
+        model=model,
+        messages=[{'role': 'user', 'content': PROMPT, 'images': [image_bytes]}],
+        format=CityCoord.model_json_schema(),
+        options={'temperature': 0},
+    )
+    return CityCoord.model_validate_json(response['message']['content'])
+
+def locate_two_step(client, image_bytes, model, gazetteer):
+    # Free-text description, then one text-only structured call to parse it.
+    # If that answer is unusable the city is looked up in the description
+    # itself; the gazetteer replaces the old chain of re-parse retries.
+    description = image_description(client, image_bytes, model)
+    response = client.chat(
+        model=model,
+        messages=[{'role': 'user', 'content': description}],
+        format=CityCoord.model_json_schema(),
+        options={'temperature': 0},
+    )
+    try:
+        return CityCoord.model_validate_json(response['message']['content'])
+    except (ValidationError, ValueError):
+        i = gazetteer.find_in_text(description)
+        if i is None:
+            raise ValueError(f"No known city in the model's description: {description[:200]}")
+        return CityCoord(**{k: v for k, v in gazetteer.city(i).items() if k != 'population'})
+
+def resolve(answer, gazetteer):
+    # Known city name in the LLM's country, or one close to the LLM's point:
+    # trust the table's coordinates over the LLM's. Otherwise keep the LLM's
+    # coordinates, check they are near a city, and flag a same-named city
+    # elsewhere ("Paris" answered with Texas coordinates is not Paris, France).
+    point = [[answer['lat'], answer['lon']]]
+    matches = gazetteer.matches(answer['city'])
+    errors = distance_matrix(point, [[gazetteer.lat[i], gazetteer.lon[i]] for i in matches])[0] if matches else []
+    chosen = [i for i in matches if gazetteer.in_country(i, answer['country'])]
+    if not chosen and matches and errors.min() <= NAME_MATCH_RADIUS_KM:
+        chosen = [matches[int(errors.argmin())]]
+    if chosen:
+        city = gazetteer.city(chosen[0])
+        error = errors[matches.index(chosen[0])]
+        return dict(answer, country=city['country'], lat=city['lat'], lon=city['lon'],
+                    source='gazetteer', llm_error_km=round(float(error), 1))
+    nearest, distance = gazetteer.nearest(answer['lat'], answer['lon'])
+    result = dict(answer, source='llm', nearest_city=gazetteer.names[int(nearest)],
+                  plausible=bool(distance <= MAX_CITY_DISTANCE_KM))
+    if matches:
+        i = matches[int(errors.argmin())]
+        result['name_conflict'] = {'city': gazetteer.names[i], 'country': gazetteer.countries[i],
+                                   'distance_km': round(float(errors.min()), 1)}
+    return result
+
+def locate(path, client, cache, model, mode, gazetteer, gate=None, payloads=None):
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+    payload = {'original_bytes': len(image_bytes), 'sent_bytes': len(image_bytes)}
+    if payloads:
+        image_bytes, seconds, reused = payloads.get(image_bytes)
+        payload.update(sent_bytes=len(image_bytes), prepare_seconds=round(seconds, 4), reused=reused)
+    # Keyed by what the LLM sees, so other resize settings get their own answers
+    key = ResultCache.key(image_bytes, model)
+    result = cache.get(key) if cache else None
+    cached = result is not None
+    screen = None
+    if not cached and gate:
+        # Cascade: only images the classifier can't rule out reach the LLM
+        screen = gate.screen(image_bytes)
+        if not screen['escalate']:
+            return {'image': path, 'skipped': True, 'screen': screen, 'cached': False,
+                    'payload': payload, 'seconds': round(time.perf_counter() - start, 2)}
+    llm_seconds = None
+    if not cached:
+        llm_start = time.perf_counter()
+        coord = None
+        if mode == 'single':
+            try:
+                coord = locate_structured(client, image_bytes, model)
+            except (ValidationError, ValueError) as e:
+                print(f" [WARN] {os.path.basename(path)}: structured answer rejected ({e.__class__.__name__}), "
+                      f"falling back to two calls")
+        if coord is None:
+            coord = locate_two_step(client, image_bytes, model, gazetteer)
+        result = coord.model_dump()
+        llm_seconds = round(time.perf_counter() - llm_start, 2)
+        if cache:
+            cache.put(key, result)
+    result = dict(resolve(result, gazetteer), image=path, cached=cached, payload=payload,
+                  seconds=round(time.perf_counter() - start, 2))
+    if llm_seconds is not None:
+        result['llm_seconds'] = llm_seconds
+    if screen:
+        result['screen'] = screen
+    return result
+
+def parse_reference(spec, gazetteer):
+    # "lat,lon" or a city name -> (label, lat, lon)
+    parts = spec.split(',')
+    if len(parts) == 2:
+        try:
+            return spec, float(parts[0]), float(parts[1])
+        except ValueError:
+            pass
+    i = gazetteer.lookup(spec)
+    if i is None:
+        sys.exit(f"Unknown reference city: {spec}")
+    city = gazetteer.city(i)
+    return f"{city['city']}, {city['country']}", city['lat'], city['lon']
+
+def describe(result, reference):
+    return (f"The image shows {result['city']}, with lat:{round(result['lat'], 2)} and long: "
+            f"{round(result['lon'], 2)}, located in {result['country']} and about "
+            f"{int(round(result['distances_km'][reference], -1)):,} kilometers away from {reference}.")
+
+def cascade_report(results, gate, llm_seconds):
+    # LLM calls avoided, priced at the mean LLM time of this batch's escalated
+    # images (llm_seconds when none was made), against the screening time
+    skipped = [r for r in results if r.get('skipped')]
+    called = [r['llm_seconds'] for r in results if 'llm_seconds' in r]
+    per_call = sum(called) / len(called) if called else llm_seconds
+    net = len(skipped) * per_call - gate.seconds
+    outcome = f"saving about {net:.1f}s" if net >= 0 else f"a net cost of {-net:.1f}s"
+    return (f"cascade: {len(skipped)} of {gate.screened} screened images never reached the LLM, "
+            f"{outcome} ({per_call:.1f}s per LLM call{'' if called else ', estimated'}; "
+            f"screening took {gate.seconds:.2f}s)")
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def payload_report(results, baseline=None):
+    # Size before/after shrinking, and latency before/after when baseline
+    # maps images to the LLM time of the same call sent the original file
+    sent = [r for r in results if not r.get('skipped')]
+    original = sum(r['payload']['original_bytes'] for r in sent)
+    if not original:
+        return 'payload: nothing sent'
+    shrunk = sum(r['payload']['sent_bytes'] for r in sent)
+    prepare = sum(r['payload'].get('prepare_seconds', 0.0) for r in sent)
+    calls = [r['llm_seconds'] for r in sent if 'llm_seconds' in r]
+    report = (f"payload: {original / 1e3:,.0f} kB of images sent as {shrunk / 1e3:,.0f} kB "
+              f"({shrunk / original:.0%}), {prepare:.2f}s preparing")
+    if baseline:
+        shrunk_calls = [r['llm_seconds'] for r in sent if r['image'] in baseline and 'llm_seconds' in r]
+        return report + (f", median LLM call {median(shrunk_calls):.1f}s shrunk vs "
+                         f"{median(baseline.values()):.1f}s unshrunk over {len(baseline)} image(s)")
+    if calls:
+        report += f", median LLM call {median(calls):.1f}s"
+    if shrunk < original:
+        report += ' (size is before/after; use --baseline N to time unshrunk calls too)'
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Locate the city in images with a vision LLM")
+    parser.add_argument('image', help='an image file or a directory of images')
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--host', default=OLLAMA_HOST, help='Ollama endpoint (or ollama_stub.py)')
+    parser.add_argument('--mode', choices=['single', 'two-step'], default='single',
+                        help='"single": one schema-constrained call, "two-step": description + text-only parse')
+    parser.add_argument('--reference', action='append',
+                        help='point to measure distances from: a city name or "lat,lon" (repeatable, '
+                             'default Santiago, Chile)')
+    parser.add_argument('--concurrency', type=int, default=2, help='requests in flight for a directory')
+    parser.add_argument('--cache', default=CACHE_PATH, help='result cache file')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--output', help='write all results to this .jsonl file')
+    parser.add_argument('--max-side', type=int, default=VISION_SIZE,
+                        help="shrink images to this longest side before sending (0 sends the original file)")
+    parser.add_argument('--quality', type=int, default=JPEG_QUALITY, help='JPEG quality of shrunk images')
+    parser.add_argument('--baseline', type=int, default=0,
+                        help='resend this many of the uncached images unshrunk, to compare LLM latency')
+    parser.add_argument('--cascade', action='store_true',
+                        help='screen images with the local MobileNet first; only likely city scenes go to the LLM')
+    parser.add_argument('--allow', help='classes that escalate to the LLM: comma separated or a .txt file '
+                                        '(default: scene_gate.CITY_LABELS)')
+    parser.add_argument('--min-confidence', type=float, default=0.3,
+                        help='below this top-1 probability the classifier is unsure and the LLM decides')
+    parser.add_argument('--llm-seconds', type=float, default=30.0,
+                        help='assumed cost of one LLM call when a batch makes none')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()  # Start timing
+    if os.path.isdir(args.image):
+        paths = sorted(os.path.join(args.image, f) for f in os.listdir(args.image)
+                       if f.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        paths = [args.image]
+    if not paths:
+        sys.exit(f"No images in {args.image}")
+    client = ollama.Client(host=args.host)
+    cache = None if args.no_cache else ResultCache(args.cache)
+    gazetteer = Gazetteer()
+    if args.reference:
+        references = [parse_reference(spec, gazetteer) for spec in args.reference]
+    else:
+        references = [('Santiago, Chile', mylat, mylon)]
+    payloads = PayloadCache(PAYLOAD_DIR, args.max_side, args.quality) if args.max_side > 0 else None
+    gate = None
+    if args.cascade:
+        from scene_gate import SceneGate, CITY_LABELS
+        allow = CITY_LABELS
+        if args.allow and os.path.isfile(args.allow):
+            with open(args.allow, 'r') as f:
+                allow = [line.strip() for line in f if line.strip()]
+        elif args.allow:
+            allow = [label.strip() for label in args.allow.split(',')]
+        try:
+            gate = SceneGate(allow, args.min_confidence)
+        except ValueError as e:
+            sys.exit(str(e))
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = [executor.submit(locate, path, client, cache, args.model, args.mode, gazetteer, gate, payloads)
+                   for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"\n [ERROR] {path}: {e}")
+        # Baseline: the first few images the LLM just saw shrunk, again as the
+        # original file and uncached, so both latencies cover the same images
+        baseline = {}
+        if payloads and args.baseline > 0:
+            sample = [r['image'] for r in results if 'llm_seconds' in r][:args.baseline]
+            futures = [executor.submit(locate, path, client, None, args.model, args.mode, gazetteer)
+                       for path in sample]
+            for path, future in zip(sample, futures):
+                try:
+                    baseline[path] = future.result()['llm_seconds']
+                except Exception as e:
+                    print(f"\n [ERROR] {path} (baseline): {e}")
+    skipped = [r for r in results if r.get('skipped')]
+    located = [r for r in results if not r.get('skipped')]
+
+    # Every image against every reference point at once
+    if located:
+        distances = distance_matrix([[r['lat'], r['lon']] for r in located],
+                                    [[lat, lon] for _, lat, lon in references])
+        for result, row in zip(located, distances):
+            result['distances_km'] = {label: round(float(d), 1) for (label, _, _), d in zip(references, row)}
+    for result in skipped:
+        label, score = result['screen']['classes'][0]
+        print(f"\n {os.path.basename(result['image'])}: not a city scene ({label}, {score:.0%}), LLM skipped")
+    for result in located:
+        source = 'cache' if result['cached'] else f"{result['seconds']:.1f}s"
+        note = '' if result.get('plausible', True) else ' [coordinates are far from any known city]'
+        if 'name_conflict' in result:
+            conflict = result['name_conflict']
+            note += (f" [kept the model's coordinates: {conflict['city']}, {conflict['country']}"
+                     f" is {conflict['distance_km']:.0f} km away]")
+        print(f"\n {os.path.basename(result['image'])} ({source}): {describe(result, references[0][0])}{note}")
+        for label, _, _ in references[1:]:
+            print(f"     {int(round(result['distances_km'][label], -1)):,} km from {label}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+    elapsed_time = time.perf_counter() - start_time  # Calculate elapsed time
+    hits = sum(r['cached'] for r in results)
+    print(f"\n [INFO] ==> {len(results)}/{len(paths)} images (running {args.model}, {args.mode}, "
+          f"{hits} from cache) took {elapsed_time:.1f} seconds to execute.")
+    if results:
+        print(f" [INFO] ==> {payload_report(results, baseline)}")
+    if gate:
+        print(f" [INFO] ==> {cascade_report(results, gate, args.llm_seconds)}")
+    print()
+
+if __name__ == '__main__':
+    main()
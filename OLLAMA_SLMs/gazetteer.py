@@ -0,0 +1,157 @@
+import csv
+import os
+import re
+import unicodedata
+import numpy as np
+
+# data/cities.csv: GeoNames cities (CC BY 4.0, geonames.org) with at least
+# 100k inhabitants plus every national capital, largest first
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.csv')
+EARTH_RADIUS_KM = 6371.0088
+
+# Everyday names for cities the table knows under another one
+CITY_ALIASES = {
+    'new york': 'New York City', 'nyc': 'New York City', 'frankfurt': 'Frankfurt am Main',
+    'washington dc': 'Washington', 'washington d c': 'Washington', 'kiev': 'Kyiv',
+    'bombay': 'Mumbai', 'calcutta': 'Kolkata', 'madras': 'Chennai', 'bangalore': 'Bengaluru',
+    'peking': 'Beijing', 'saigon': 'Ho Chi Minh City',
+}
+COUNTRY_ALIASES = {
+    'usa': 'united states', 'u s a': 'united states', 'u s': 'united states',
+    'united states of america': 'united states', 'uk': 'united kingdom', 'u k': 'united kingdom',
+    'britain': 'united kingdom', 'great britain': 'united kingdom', 'england': 'united kingdom',
+    'scotland': 'united kingdom', 'wales': 'united kingdom',
+}
+# City names that are also ordinary English words ("a mobile phone", "a
+# nice view"): in free text they only count with their country close by
+COMMON_WORD_NAMES = {
+    'aurora', 'bath', 'buffalo', 'concord', 'cork', 'delta', 'derby', 'enterprise', 'gent', 'hub',
+    'hue', 'independence', 'man', 'mango', 'mesa', 'metro', 'mobile', 'natal', 'nice', 'orange',
+    'paradise', 'providence', 'reading', 'sale', 'san', 'split', 'surprise', 'tours', 'van', 'victoria',
+}
+COUNTRY_WINDOW = 8  # words between a city name and its country in free text
+
+
+def normalize(name):
+    # "São Paulo, " -> "sao paulo": accents dropped, any punctuation a space
+    text = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def country_key(country):
+    key = normalize(country)
+    return COUNTRY_ALIASES.get(key, key)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Great-circle distance, broadcasting over any array shapes
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(points_a, points_b):
+    # (A, 2) and (B, 2) arrays of [lat, lon] -> (A, B) km, in one pass
+    a = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+    return haversine_km(a[:, None, 0], a[:, None, 1], b[None, :, 0], b[None, :, 1])
+
+
+def unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+class Gazetteer:
+    """The bundled city table as flat arrays, loaded once.
+
+    Coordinates are float32 columns plus unit vectors on the sphere, so the
+    nearest city to a set of points is one matrix product (the largest dot
+    product is the smallest great-circle angle). Names are indexed normalized,
+    each mapping to its cities by population, and so are the aliases in
+    ``CITY_ALIASES``.
+    """
+
+    def __init__(self, path=CITIES_PATH):
+        names, countries, lat, lon, population = [], [], [], [], []
+        with open(path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                names.append(row['name'])
+                countries.append(row['country'])
+                lat.append(float(row['lat']))
+                lon.append(float(row['lon']))
+                population.append(int(row['population']))
+        self.names = names
+        self.countries = countries
+        self.lat = np.array(lat, dtype=np.float32)
+        self.lon = np.array(lon, dtype=np.float32)
+        self.population = np.array(population, dtype=np.int64)
+        self.vectors = unit_vectors(self.lat, self.lon).astype(np.float32)
+        self.country_keys = [country_key(c) for c in countries]
+        self.by_name = {}
+        for i in np.argsort(-self.population):
+            self.by_name.setdefault(normalize(names[i]), []).append(int(i))
+        for alias, name in CITY_ALIASES.items():
+            self.by_name.setdefault(alias, []).extend(self.by_name.get(normalize(name), []))
+        self.max_words = max(len(name.split()) for name in self.by_name)
+        self.country_names = dict(COUNTRY_ALIASES, **{key: key for key in self.country_keys})
+
+    def __len__(self):
+        return len(self.names)
+
+    def city(self, i):
+        return {'city': self.names[i], 'country': self.countries[i], 'lat': float(self.lat[i]),
+                'lon': float(self.lon[i]), 'population': int(self.population[i])}
+
+    def matches(self, name):
+        # Indices of every city called name, largest first
+        return self.by_name.get(normalize(name), [])
+
+    def in_country(self, i, country):
+        return bool(country) and self.country_keys[i] == country_key(country)
+
+    def lookup(self, name, country=None):
+        # Index of the largest city called name (in country, when it matches), or None
+        matches = self.matches(name)
+        in_country = [i for i in matches if self.in_country(i, country)]
+        matches = in_country or matches
+        return matches[0] if matches else None
+
+    def nearest(self, lat, lon):
+        # Nearest city to each point: (indices, distances in km), same shape as lat
+        points = unit_vectors(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        best = np.argmax(points.reshape(-1, 3).astype(np.float32) @ self.vectors.T, axis=1)
+        best = best.reshape(np.shape(lat))
+        return best, haversine_km(lat, lon, self.lat[best], self.lon[best])
+
+    def ngrams(self, words, names, max_words):
+        # (start, size, key) of every run of up to max_words words found in
+        # names, longest runs first
+        for size in range(max_words, 0, -1):
+            for start in range(len(words) - size + 1):
+                key = ' '.join(words[start:start + size])
+                if key in names:
+                    yield start, size, key
+
+    def find_in_text(self, text):
+        # Index of the city named in free text, or None. The longest name
+        # wins ("new york" over "york"); among cities of that length, one
+        # whose country is named within COUNTRY_WINDOW words comes first,
+        # then the largest. Everyday words need their country nearby.
+        words = normalize(text).split()
+        countries = {}
+        for start, size, key in self.ngrams(words, self.country_names, 3):
+            countries.setdefault(self.country_names[key], []).append(start)
+        best_size, best = 0, None
+        for start, size, name in self.ngrams(words, self.by_name, self.max_words):
+            if size < best_size:
+                break
+            for i in self.by_name[name]:
+                nearby = any(abs(p - start) <= COUNTRY_WINDOW for p in countries.get(self.country_keys[i], []))
+                if name in COMMON_WORD_NAMES and not nearby:
+                    continue
+                rank = (nearby, int(self.population[i]))
+                if best is None or rank > best[0]:
+                    best_size, best = size, (rank, i)
+        return best[1] if best else None
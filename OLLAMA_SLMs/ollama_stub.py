@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned answers; an image always gets the same city (picked by its hash)
+CITIES = [
+    {'city': 'Paris', 'country': 'France', 'lat': 48.8566, 'lon': 2.3522},
+    {'city': 'Rio de Janeiro', 'country': 'Brazil', 'lat': -22.9068, 'lon': -43.1729},
+    {'city': 'Sydney', 'country': 'Australia', 'lat': -33.8688, 'lon': 151.2093},
+    {'city': 'New York', 'country': 'United States', 'lat': 40.7128, 'lon': -74.0060},
+]
+
+stats = {'requests': 0, 'chat': 0, 'generate': 0, 'embed': 0, 'embedded_texts': 0}
+stats_lock = threading.Lock()
+delay = 0.0
+token_delay = 0.0
+
+
+def pick_city(messages):
+    # By image content when there is one, otherwise by the prompt text
+    images = [image for m in messages for image in m.get('images') or []]
+    text = images[0] if images else ' '.join(str(m.get('content', '')) for m in messages)
+    for city in CITIES:
+        if city['city'] in text:
+            return city
+    return CITIES[int(hashlib.sha256(text.encode()).hexdigest(), 16) % len(CITIES)]
+
+
+def answer(messages, structured):
+    city = pick_city(messages)
+    if structured:
+        return json.dumps(city)
+    return (f"The image shows {city['city']}, {city['country']}. Its latitude is "
+            f"{city['lat']} and its longitude is {city['lon']}.")
+
+
+def embedding(text, size=64):
+    # Deterministic unit vector per text: bag of hashed words, so texts
+    # sharing words land close together and retrieval behaves plausibly
+    vector = np.zeros(size, dtype=np.float32)
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % size] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """The parts of the Ollama API the scripts in this folder use."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def count(self, kind):
+        with stats_lock:
+            stats['requests'] += 1
+            stats[kind] = stats.get(kind, 0) + 1
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, chunks):
+        # NDJSON over chunked transfer encoding, one line per chunk as Ollama does
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            line = json.dumps(chunk).encode() + b'\n'
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self.send_json({'models': [{'name': 'stub', 'model': 'stub'}]})
+        elif self.path == '/api/version':
+            self.send_json({'version': '0.0.0-stub'})
+        elif self.path == '/stub/stats':
+            with stats_lock:
+                self.send_json(dict(stats))
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(delay)
+        if self.path == '/api/chat':
+            self.count('chat')
+            content = answer(body.get('messages', []), bool(body.get('format')))
+            self.send_json({'model': body.get('model', 'stub'), 'created_at': '1970-01-01T00:00:00Z',
+                            'message': {'role': 'assistant', 'content': content},
+                            'done': True, 'done_reason': 'stop'})
+        elif self.path == '/api/generate':
+            self.count('generate')
+            prompt = body.get('prompt', '')
+            tokens = f"Stub answer to: {prompt[-80:]}".split(' ')
+            head = {'model': body.get('model', 'stub'), 'created_at': '1970-01-01T00:00:00Z'}
+            done = dict(head, response='', done=True, done_reason='stop',
+                        prompt_eval_count=len(prompt.split()), eval_count=len(tokens),
+                        eval_duration=int(len(tokens) * token_delay * 1e9))
+            if body.get('stream', True):
+                def chunks():
+                    for i, token in enumerate(tokens):
+                        time.sleep(token_delay)
+                        yield dict(head, response=token if i == 0 else ' ' + token, done=False)
+                    yield done
+                self.send_stream(chunks())
+            else:
+                time.sleep(token_delay * len(tokens))
+                self.send_json(dict(done, response=' '.join(tokens)))
+        elif self.path == '/api/embed':
+            # One request may carry a whole batch of inputs
+            texts = body.get('input', [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self.count('embed')
+            with stats_lock:
+                stats['embedded_texts'] += len(texts)
+            self.send_json({'model': body.get('model', 'stub'), 'embeddings': [embedding(t) for t in texts]})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+
+def main():
+    global delay, token_delay
+    parser = argparse.ArgumentParser(description="Minimal stand-in for the Ollama server, for tests")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds added to every answer')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='seconds per generated token')
+    args = parser.parse_args()
+    delay = args.delay
+    token_delay = args.token_delay
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StubHandler)
+    print(f"Ollama stub on http://127.0.0.1:{args.port} (GET /stub/stats for request counts)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
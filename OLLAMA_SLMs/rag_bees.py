@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import ollama
+import chromadb
+
+EMB_MODEL = "nomic-embed-text"  # "mxbai-embed-large" #"all-minilm"
+MODEL = "llama3.2:3b"
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rag_data')
+BATCH_SIZE = 32
+ANSWER_CACHE_SIZE = 256
+SIMILARITY_THRESHOLD = 0.95  # cosine similarity of two questions to share an answer
+
+documents = [
+    "Bee-keeping, also known as apiculture, involves the maintenance of bee colonies, typically in hives, by humans.",
+    "The most commonly kept species of bees is the European honey bee (Apis mellifera).",
+    "Bee-keeping dates back to at least 4,500 years ago, with evidence of ancient Egyptians practicing it.",
+    "A beekeeper's primary role is to manage hives to ensure the health of the bee colony and maximize honey production.",
+    "Honey bees are social insects, living in colonies with a single queen, numerous worker bees, and drones.",
+    "The queen bee can lay up to 2,000 eggs per day during peak seasons.",
+    "Worker bees are female and perform all the tasks in the hive except for reproduction.",
+    "Drones are male bees whose primary role is to mate with a queen from another hive.",
+    "Honey bees communicate with each other through the 'waggle dance,' which indicates the direction and distance to food sources.",
+    "Bees produce honey from the nectar they collect from flowers, which they store in the hive for food during winter.",
+    "Bees also produce beeswax, which they use to build the honeycomb structure in the hive.",
+    "Propolis, another bee product, is a resin-like substance collected from tree buds and used to seal gaps in the hive.",
+    "Bees play a crucial role in pollination, which is essential for the reproduction of many plants and crops.",
+    "A typical bee colony can contain between 20,000 and 80,000 bees.",
+    "Bee-keeping can be done for various purposes, including honey production, pollination services, and the sale of bees and related products.",
+    "Beekeepers must inspect their hives regularly to check for diseases, pests, and the overall health of the colony.",
+    "Common pests and diseases that affect bees include varroa mites, hive beetles, and foulbrood.",
+    "Bee-keeping requires protective clothing and equipment, such as a bee suit, gloves, and a smoker to calm the bees.",
+    "Sustainable bee-keeping practices are important for maintaining healthy bee populations and ecosystems.",
+    "Beekeeping can be a hobby, a part-time occupation, or a full-time profession, depending on the scale and intent of the beekeeper.",
+    "Almost all the honey we consume comes from western honey bees (Apis mellifera), a hybrid of European and African species.",
+    "There are another 20,000 different bee species in the world.",
+    "Brazil alone has more than 300 different bee species, and the vast majority, unlike western honey bees, don’t sting.",
+    "Reports written in 1577 by Hans Staden, mention three native bees used by indigenous people in Brazil.",
+    "The indigenous people in Brazil used bees for medicine and food purposes",
+    "From Hans Staden report: probable species: mandaçaia (Melipona quadrifasciata), mandaguari (Scaptotrigona postica) and jataí-amarela (Tetragonisca angustula).",
+]
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Embeddings on disk (SQLite), keyed by text hash and embedding model.
+
+    Texts that were embedded before, in this or any earlier run, never go to
+    the model again; the rest are embedded in batches of ``batch_size``.
+    """
+
+    def __init__(self, path, client, model=EMB_MODEL, batch_size=BATCH_SIZE):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                        "(hash TEXT, model TEXT, vector BLOB, PRIMARY KEY (hash, model))")
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, hashes):
+        found = {}
+        with self.lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})",
+                    [self.model] + chunk)
+                found.update((h, np.frombuffer(v, dtype=np.float32)) for h, v in rows)
+        return found
+
+    def embed(self, texts):
+        # One float32 vector per text, in order
+        hashes = [content_hash(t) for t in texts]
+        vectors = self.lookup(list(set(hashes)))
+        missing = list(dict.fromkeys(t for t, h in zip(texts, hashes) if h not in vectors))
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            response = self.client.embed(model=self.model, input=batch)
+            rows = []
+            for text, embedding in zip(batch, response['embeddings']):
+                vector = np.asarray(embedding, dtype=np.float32)
+                vectors[content_hash(text)] = vector
+                rows.append((content_hash(text), self.model, vector.tobytes()))
+            with self.lock:
+                self.db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+                self.db.commit()
+        return [vectors[h] for h in hashes]
+
+
+class SemanticCache:
+    """Answers of earlier questions, reused for the same or a near-identical question.
+
+    A stored answer only matches when the retrieved context, model and options
+    are the same (``key()``) and the cosine similarity of the two question
+    embeddings is at least ``threshold``. At most ``max_entries`` answers are
+    kept; the least recently used one is evicted first.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # id -> (key, unit vector, answer)
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, data, options):
+        return content_hash(json.dumps([model, data, options], sort_keys=True))
+
+    @staticmethod
+    def unit(vector):
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector, key):
+        vector = self.unit(vector)
+        with self.lock:
+            candidates = [(i, v) for i, (k, v, _) in self.entries.items() if k == key]
+            if candidates:
+                similarity = np.stack([v for _, v in candidates]) @ vector
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.threshold:
+                    entry_id = candidates[best][0]
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self.entries[entry_id][2]
+            self.misses += 1
+            return None
+
+    def put(self, vector, key, answer):
+        with self.lock:
+            self.entries[self.next_id] = (key, self.unit(vector), answer)
+            self.next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class RagIndex:
+    """Persistent Chroma collection over a document list, kept in sync incrementally.
+
+    Documents are stored under the hash of their text, so ``sync()`` only adds
+    new or edited documents and deletes ones that are gone; unchanged ones are
+    neither embedded nor rewritten. Timings of every phase end up in
+    ``timings`` for the latency report.
+    """
+
+    def __init__(self, docs=None, path=DATA_DIR, name="bee_facts", emb_model=EMB_MODEL, model=MODEL,
+                 host=OLLAMA_HOST, answer_cache=None):
+        self.timings = {}
+        start = time.perf_counter()
+        os.makedirs(path, exist_ok=True)
+        self.model = model
+        self.emb_model = emb_model
+        self.client = ollama.Client(host=host)
+        self.embeddings = EmbeddingCache(os.path.join(path, 'embeddings.sqlite'), self.client, emb_model)
+        self.chroma = chromadb.PersistentClient(path=os.path.join(path, 'chroma'))
+        # Vectors of different embedding models cannot share a collection
+        self.collection = self.chroma.get_or_create_collection(
+            name=f"{name}-{content_hash(emb_model)[:8]}", metadata={'embedding_model': emb_model})
+        self.timings['open_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        self.answers = answer_cache if answer_cache is not None else SemanticCache()
+        self.sync_stats = {}
+        self.queries = []
+        self.last_timing = None
+        if docs is not None:
+            self.sync(docs)
+
+    def sync(self, docs):
+        start = time.perf_counter()
+        wanted = {content_hash(d): d for d in docs}
+        stored = set(self.collection.get(include=[])['ids'])
+        added = [h for h in wanted if h not in stored]
+        removed = [h for h in stored if h not in wanted]
+        if removed:
+            self.collection.delete(ids=removed)
+        misses_before = self.embeddings.misses
+        if added:
+            texts = [wanted[h] for h in added]
+            vectors = self.embeddings.embed(texts)
+            self.collection.add(ids=added, documents=texts, embeddings=[v.tolist() for v in vectors])
+        self.sync_stats = {'documents': len(wanted), 'unchanged': len(wanted) - len(added),
+                           'added': len(added), 'removed': len(removed),
+                           'embedded': self.embeddings.misses - misses_before}
+        self.timings['sync_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return self.sync_stats
+
+    def stream(self, prompt, n_results=5, temp=0.0, top_k=10, top_p=0.5):
+        # Yields the answer piece by piece as the model produces it; timings of
+        # the query are in last_timing once the generator is exhausted
+        t0 = time.perf_counter()
+        vector = self.embeddings.embed([prompt])[0]
+        t1 = time.perf_counter()
+        data = self.collection.query(query_embeddings=[vector.tolist()], n_results=n_results)['documents']
+        t2 = time.perf_counter()
+        options = {"temperature": temp, "top_k": top_k, "top_p": top_p}
+        key = SemanticCache.key(self.model, data, options)
+        timing = {'embed_ms': round((t1 - t0) * 1000, 1), 'retrieve_ms': round((t2 - t1) * 1000, 1)}
+        answer = self.answers.get(vector, key)
+        if answer is not None:
+            yield answer
+            timing.update(cached=True, total_ms=round((time.perf_counter() - t0) * 1000, 1))
+        else:
+            pieces = []
+            first = None
+            final = {}
+            for chunk in self.client.generate(model=self.model,
+                                              prompt=f"Using this data: {data}. Respond to this prompt: {prompt}",
+                                              options=options, stream=True):
+                if chunk['response']:
+                    if first is None:
+                        first = time.perf_counter()
+                    pieces.append(chunk['response'])
+                    yield chunk['response']
+                if chunk['done']:
+                    final = chunk
+            t3 = time.perf_counter()
+            first = first or t3
+            # Ollama's own eval counters when present, otherwise what we saw
+            tokens = final.get('eval_count') or len(pieces)
+            eval_seconds = (final.get('eval_duration') or 0) / 1e9 or (t3 - first)
+            timing.update(cached=False, ttft_ms=round((first - t0) * 1000, 1),
+                          generate_ms=round((t3 - t2) * 1000, 1), total_ms=round((t3 - t0) * 1000, 1),
+                          tokens=tokens, tokens_per_s=round(tokens / eval_seconds, 1) if eval_seconds else None)
+            self.answers.put(vector, key, ''.join(pieces))
+        self.queries.append(timing)
+        self.last_timing = timing
+
+    def query(self, prompt, n_results=5, temp=0.0, top_k=10, top_p=0.5):
+        # Returns the whole answer and its timings in ms
+        answer = ''.join(self.stream(prompt, n_results, temp, top_k, top_p))
+        return answer, self.last_timing
+
+    def report(self):
+        report = {'startup': dict(self.timings, **self.sync_stats),
+                  'embedding_cache': {'hits': self.embeddings.hits, 'misses': self.embeddings.misses},
+                  'answer_cache': {'hits': self.answers.hits, 'misses': self.answers.misses,
+                                   'entries': len(self.answers.entries)}}
+        # Medians, separately for generated and cached answers
+        for name, cached in (('generated', False), ('cached', True)):
+            queries = [q for q in self.queries if q['cached'] == cached]
+            if queries:
+                report[name] = {key: round(float(np.median([q[key] for q in queries])), 1)
+                                for key in queries[0] if key != 'cached' and queries[0][key] is not None}
+                report[name]['count'] = len(queries)
+        return report
+
+
+index = None
+
+def rag_bees(prompt, n_results=5, temp=0.0, top_k=10, top_p=0.5):
+    # Same call as in the notebook; the index is opened (and synced) on first use
+    global index
+    start_time = time.perf_counter()  # Start timing
+    if index is None:
+        index = RagIndex(documents)
+
+    pieces = []
+    for piece in index.stream(prompt, n_results, temp, top_k, top_p):
+        print(piece, end='', flush=True)
+        pieces.append(piece)
+    print()
+    answer = ''.join(pieces)
+
+    end_time = time.perf_counter()  # End timing
+    elapsed_time = round((end_time - start_time), 1)  # Calculate elapsed time
+
+    print(f"\n [INFO] ==> The code for model: {index.model}, took {elapsed_time}s \
+          to generate the answer.\n")
+    print(f" [INFO] ==> {describe_timing(index.last_timing)}")
+    return answer
+
+def describe_timing(timing):
+    if timing['cached']:
+        return f"answer from cache: embed {timing['embed_ms']} ms, total {timing['total_ms']} ms"
+    speed = f", {timing['tokens_per_s']} tokens/s" if timing['tokens_per_s'] else ''
+    return (f"embed {timing['embed_ms']} ms, retrieve {timing['retrieve_ms']} ms, first token "
+            f"{timing['ttft_ms']} ms, total {timing['total_ms']} ms, {timing['tokens']} tokens{speed}")
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG over the bee facts (or your own documents) with Ollama")
+    parser.add_argument('prompts', nargs='*', default=["How many bees are in a colony? Who lays eggs and how "
+                                                       "much? How about common pests and diseases?"])
+    parser.add_argument('--docs', help='text file with one document per line instead of the bee facts')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='where the vector store and embedding cache live')
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--emb-model', default=EMB_MODEL)
+    parser.add_argument('--host', default=OLLAMA_HOST)
+    parser.add_argument('--n-results', type=int, default=5)
+    parser.add_argument('--cache-size', type=int, default=ANSWER_CACHE_SIZE, help='answers kept (0 disables)')
+    parser.add_argument('--similarity', type=float, default=SIMILARITY_THRESHOLD,
+                        help='question similarity needed to reuse a cached answer')
+    args = parser.parse_args()
+
+    docs = documents
+    if args.docs:
+        with open(args.docs, 'r', encoding='utf-8') as f:
+            docs = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    rag = RagIndex(docs, args.data_dir, emb_model=args.emb_model, model=args.model, host=args.host,
+                   answer_cache=SemanticCache(args.cache_size, args.similarity))
+    stats = rag.sync_stats
+    print(f" [INFO] ==> Index ready in {(time.perf_counter() - start) * 1000:.0f} ms: {stats['documents']} "
+          f"documents, {stats['added']} added ({stats['embedded']} embedded), {stats['removed']} removed, "
+          f"{stats['unchanged']} unchanged")
+
+    for prompt in args.prompts:
+        print(f"\n> {prompt}")
+        for piece in rag.stream(prompt, args.n_results):
+            print(piece, end='', flush=True)
+        print(f"\n\n [INFO] ==> {describe_timing(rag.last_timing)} ({args.model})")
+    print(f"\n [INFO] ==> {rag.report()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import io
+import os
+import threading
+import time
+import numpy as np
+from PIL import Image
+import tflite_runtime.interpreter as tflite
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'IMG_CLASS', 'models')
+MODEL_PATH = os.path.join(MODELS_DIR, 'mobilenet_v2_1.0_224_quant.tflite')
+LABELS_PATH = os.path.join(MODELS_DIR, 'labels.txt')
+
+# ImageNet classes that show up in photos of cities: buildings, landmarks,
+# streets and waterfronts. Anything else is only escalated when the
+# classifier is unsure.
+CITY_LABELS = [
+    'palace', 'church', 'mosque', 'monastery', 'castle', 'bell cote', 'dome', 'triumphal arch',
+    'obelisk', 'stupa', 'planetarium', 'water tower', 'library', 'cinema', 'restaurant', 'prison',
+    'grocery store', 'tobacco shop', 'bookshop', 'vault', 'altar', 'tile roof', 'patio', 'fountain',
+    'pedestal', 'sundial', 'totem pole', 'megalith', 'suspension bridge', 'steel arch bridge',
+    'viaduct', 'pier', 'dock', 'breakwater', 'boathouse', 'dam', 'streetcar', 'trolleybus', 'cab',
+    'passenger car', 'bullet train', 'school bus', 'minibus', 'limousine', 'traffic light',
+    'street sign', 'parking meter', 'container ship', 'liner', 'fireboat', 'gondola', 'schooner',
+    'yawl', 'catamaran', 'lakeside', 'seashore', 'promontory', 'cliff', 'valley', 'alp',
+]
+
+
+def load_labels(path=LABELS_PATH):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+class SceneGate:
+    """MobileNet V2 as a cheap first stage in front of the vision LLM.
+
+    ``screen()`` classifies an encoded image in a few milliseconds and says
+    whether it is worth an LLM call: one of the ``top_k`` classes is in the
+    allow-list, or the best class is below ``min_confidence`` (the classifier
+    does not know what it is looking at, so the LLM gets to decide).
+    Each calling thread gets its own interpreter, so the batch workers screen
+    side by side and ``seconds`` is screening work, not time spent waiting.
+    """
+
+    def __init__(self, allow=CITY_LABELS, min_confidence=0.3, top_k=3,
+                 model_path=MODEL_PATH, labels_path=LABELS_PATH, num_threads=None):
+        self.labels = load_labels(labels_path)
+        self.allow = set(allow)
+        unknown = self.allow.difference(self.labels)
+        if unknown:
+            raise ValueError(f"Not in {labels_path}: {', '.join(sorted(unknown))}")
+        self.min_confidence = min_confidence
+        self.top_k = top_k
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.local = threading.local()
+        self.lock = threading.Lock()  # guards the counters below
+        interpreter = self.interpreter()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.input_dtype = input_details['dtype']
+        self.height, self.width = (int(v) for v in input_details['shape'][1:3])
+        self.output_index = output_details['index']
+        self.output_scale, self.output_zero_point = output_details['quantization']
+        self.screened = 0
+        self.seconds = 0.0
+
+    def interpreter(self):
+        # This thread's interpreter, created on its first screen
+        interpreter = getattr(self.local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = tflite.Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self.local.interpreter = interpreter
+        return interpreter
+
+    def probabilities(self, image_bytes):
+        img = Image.open(io.BytesIO(image_bytes))
+        # Let the JPEG decoder downscale by up to 8x before the exact resize
+        img.draft('RGB', (self.width, self.height))
+        img = img.convert('RGB').resize((self.width, self.height))
+        input_data = np.expand_dims(np.asarray(img), axis=0)
+        if self.input_dtype != np.uint8:
+            input_data = (input_data.astype(np.float32) - 127.5) / 127.5
+        interpreter = self.interpreter()
+        interpreter.set_tensor(self.input_index, input_data.astype(self.input_dtype))
+        interpreter.invoke()
+        logits = interpreter.get_tensor(self.output_index)[0].astype(np.float32)
+        if self.output_scale:
+            logits = (logits - self.output_zero_point) * self.output_scale
+        # This MobileNet ends in logits; softmax makes min_confidence a probability
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+    def screen(self, image_bytes):
+        start = time.perf_counter()
+        scores = self.probabilities(image_bytes)
+        top = np.argsort(scores)[::-1][:self.top_k]
+        classes = [(self.labels[i], round(float(scores[i]), 3)) for i in top]
+        matched = [label for label, _ in classes if label in self.allow]
+        uncertain = classes[0][1] < self.min_confidence
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.screened += 1
+            self.seconds += seconds
+        return {'escalate': bool(matched) or uncertain,
+                'reason': 'allow-list' if matched else ('low confidence' if uncertain else 'rejected'),
+                'classes': classes, 'gate_seconds': round(seconds, 4)}